@@ -0,0 +1,406 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""A fake HAProxy stats socket for benchmarks
+
+It creates a UNIX socket per HAProxy process in a directory and answers the
+commands which haproxytool sends, for a synthetic configuration of the given
+size. It supports the interactive mode and many commands in a single line
+separated by a semicolon, and it counts the connections and the lines it
+receives, which are the round trips a real HAProxy would see.
+
+Usage:
+    fakehap.py [options] DIR
+
+Arguments:
+    DIR     Directory to create the socket files in
+
+Options:
+    -h, --help             show this screen
+    --nbproc=N             number of HAProxy processes [default: 2]
+    --frontends=N          number of frontends [default: 10]
+    --backends=N           number of backends [default: 10]
+    --servers=N            number of servers per backend [default: 10]
+    --map-entries=N        number of entries of the map [default: 1000]
+    --acl-entries=N        number of patterns of the acl [default: 1000]
+    --large-map-entries=N  number of entries of the large map, which has
+                           ID 1 [default: 300000]
+    --latency=SECONDS      time to process a command [default: 0]
+
+"""
+import os
+import re
+import time
+import socket
+import threading
+from collections import OrderedDict
+from docopt import docopt
+from six.moves import socketserver
+
+FIELDS = [
+    'pxname', 'svname', 'qcur', 'qmax', 'scur', 'smax', 'slim', 'stot', 'bin',
+    'bout', 'dreq', 'dresp', 'ereq', 'econ', 'eresp', 'wretr', 'wredis',
+    'status', 'weight', 'act', 'bck', 'chkfail', 'chkdown', 'lastchg',
+    'downtime', 'qlimit', 'pid', 'iid', 'sid', 'throttle', 'lbtot', 'tracked',
+    'type', 'rate', 'rate_lim', 'rate_max', 'check_status', 'check_code',
+    'check_duration', 'hrsp_1xx', 'hrsp_2xx', 'hrsp_3xx', 'hrsp_4xx',
+    'hrsp_5xx', 'hrsp_other', 'hanafail', 'req_rate', 'req_rate_max',
+    'req_tot', 'cli_abrt', 'srv_abrt', 'comp_in', 'comp_out', 'comp_byp',
+    'comp_rsp', 'lastsess', 'last_chk', 'last_agt', 'qtime', 'ctime', 'rtime',
+    'ttime', 'addr',
+]
+HEADER = "# {},".format(','.join(FIELDS))
+# State of a server after 'set server <backend>/<server> state <state>'
+STATES = {'ready': 'UP', 'drain': 'DRAIN', 'maint': 'MAINT'}
+MAP_FILE = '/etc/haproxy/bench.map'
+LARGE_MAP_FILE = '/etc/haproxy/large.map'
+ACL_FILE = '/etc/haproxy/bench.acl'
+# Commands of a line are separated by a semicolon which isn't escaped
+SEMICOLON = re.compile(r'(?<!\\);')
+# Arguments of a command are separated by spaces which aren't escaped
+SPACES = re.compile(r'(?<!\\) +')
+ESCAPED = re.compile(r'\\(.)')
+
+
+class Process(object):
+    """State of a HAProxy process
+
+    Argument:
+        process_nb (int): Process number
+        nbproc (int): Number of processes
+        config (dict): Number of frontends, backends, servers per backend,
+            map entries, entries of the large map and acl patterns
+        latency (float): Time to process a command
+    """
+    def __init__(self, process_nb, nbproc, config, latency=0):
+        self.process_nb = process_nb
+        self.nbproc = nbproc
+        self.latency = latency
+        self.started = time.time()
+        self.lock = threading.Lock()
+        # Counters of the work clients caused
+        self.connections = 0
+        self.lines = 0
+        self.commands = 0
+        self.frontends = OrderedDict(
+            ('frontend{}'.format(x), {'status': 'OPEN', 'maxconn': 1000})
+            for x in range(config['frontends']))
+        self.backends = OrderedDict()
+        for backend in range(config['backends']):
+            self.backends['backend{}'.format(backend)] = OrderedDict(
+                ('server{}'.format(x), {
+                    'status': 'UP',
+                    'weight': 1,
+                    'scur': (backend + x + process_nb) % 7,
+                    'stot': backend * 1000 + x,
+                    'addr': '10.{}.{}.{}:80'.format(
+                        backend // 256 % 256, backend % 256, x % 256),
+                }) for x in range(config['servers']))
+        self.maps = [OrderedDict(('key{}'.format(x), 'value{}'.format(x))
+                                 for x in range(entries))
+                     for entries in (config['map_entries'],
+                                     config['large_map_entries'])]
+        self.acls = [OrderedDict(('/path{}'.format(x), None)
+                                 for x in range(config['acl_entries']))]
+        # Versions created by prepare map/acl, (kind, id, version): entries
+        self.versions = {}
+        self.version = 0
+
+    def reset_counters(self):
+        with self.lock:
+            self.connections = 0
+            self.lines = 0
+            self.commands = 0
+
+    def handle(self, cmd):
+        """Return the output of a command as a list of lines"""
+        if self.latency:
+            time.sleep(self.latency)
+        words = [ESCAPED.sub(r'\1', x) for x in SPACES.split(cmd) if x]
+        if not words:
+            return []
+        with self.lock:
+            self.commands += 1
+            try:
+                return self._handle(words)
+            except (IndexError, KeyError, ValueError):
+                return ['Unknown map identifier. Please use #<id> or <file>.']
+
+    def _handle(self, words):
+        # pylint: disable=too-many-return-statements,too-many-branches
+        if words[:2] == ['show', 'info']:
+            return self.info()
+        if words[:2] == ['show', 'stat']:
+            return self.stat(int(words[3]) if len(words) > 3 else -1)
+        if words[:2] == ['show', 'errors']:
+            return ['Total events captured on [01/Jan/2018:00:00:00] : 0']
+        if 'frontend' in words[1:3]:
+            return self.frontend(words)
+        if words[1:2] == ['server'] or words[:2] == ['set', 'weight']:
+            return self.server(words)
+        if words[1:2] in (['map'], ['acl']):
+            return self.pattern(words)
+
+        return ['Unknown command.']
+
+    def info(self):
+        uptime = int(time.time() - self.started)
+        return [
+            'Name: HAProxy', 'Version: 1.8.0', 'Release_date: 2017/11/26',
+            'Nbproc: {}'.format(self.nbproc),
+            'Process_num: {}'.format(self.process_nb),
+            'Pid: {}'.format(1000 + self.process_nb),
+            'Uptime: 0d 0h00m{:02d}s'.format(uptime % 60),
+            'Uptime_sec: {}'.format(uptime), 'Memmax_MB: 0',
+            'Ulimit-n: 4096', 'Maxsock: 4096', 'Maxconn: 2000',
+            'CurrConns: 1', 'CumConns: 10', 'CumReq: 10', 'Tasks: 10',
+            'Run_queue: 1', 'Idle_pct: 100', 'node: bench', 'description: ',
+        ]
+
+    @staticmethod
+    def row(values):
+        return "{},".format(','.join(str(values.get(x, '')) for x in FIELDS))
+
+    def stat(self, obj_type):
+        """Return the output of show stat, obj_type is a bit mask"""
+        if obj_type == -1:
+            obj_type = 7
+        lines = [HEADER]
+        for iid, (name, frontend) in enumerate(self.frontends.items(), 1):
+            if obj_type & 1:
+                lines.append(self.row({
+                    'pxname': name, 'svname': 'FRONTEND', 'iid': iid,
+                    'status': frontend['status'], 'slim': frontend['maxconn'],
+                    'scur': iid % 5, 'stot': iid * 100, 'req_tot': iid * 100,
+                    'pid': self.process_nb, 'type': 0}))
+        for iid, (name, servers) in enumerate(self.backends.items(),
+                                              len(self.frontends) + 1):
+            for sid, (svname, server) in enumerate(servers.items(), 1):
+                # Sessions of servers which don't get traffic finish
+                if server['status'] in ('DRAIN', 'MAINT'):
+                    server['scur'] = max(0, server['scur'] - 1)
+                if obj_type & 4:
+                    lines.append(self.row({
+                        'pxname': name, 'svname': svname, 'iid': iid,
+                        'sid': sid, 'status': server['status'],
+                        'weight': server['weight'], 'scur': server['scur'],
+                        'stot': server['stot'], 'addr': server['addr'],
+                        'check_status': 'L4OK', 'act': 1, 'bck': 0,
+                        'qcur': 0, 'pid': self.process_nb, 'type': 2}))
+            if obj_type & 2:
+                lines.append(self.row({
+                    'pxname': name, 'svname': 'BACKEND', 'iid': iid,
+                    'status': 'UP', 'weight': len(servers),
+                    'scur': sum(x['scur'] for x in servers.values()),
+                    'stot': iid * 1000, 'act': len(servers), 'bck': 0,
+                    'qcur': 0, 'pid': self.process_nb, 'type': 1}))
+
+        return lines
+
+    def frontend(self, words):
+        frontend = self.frontends.get(words[words.index('frontend') + 1])
+        if frontend is None:
+            return ['No such frontend.']
+        if words[:3] == ['set', 'maxconn', 'frontend']:
+            frontend['maxconn'] = int(words[4])
+        elif words[0] in ('enable', 'disable', 'shutdown'):
+            frontend['status'] = 'OPEN' if words[0] == 'enable' else 'STOP'
+        else:
+            return ['Unknown command.']
+
+        return []
+
+    def server(self, words):
+        try:
+            backend, name = words[2].split('/', 1)
+            server = self.backends[backend][name]
+        except (ValueError, KeyError):
+            return ['No such server.']
+        if words[0] in ('enable', 'disable'):
+            server['status'] = 'UP' if words[0] == 'enable' else 'MAINT'
+        elif words[0] == 'set' and words[1] == 'weight':
+            server['weight'] = int(words[3])
+        elif words[0] == 'set' and words[3] == 'state':
+            server['status'] = STATES[words[4]]
+        elif words[0] == 'set' and words[3] == 'addr':
+            server['addr'] = "{}:{}".format(words[4],
+                                            server['addr'].split(':')[1])
+        else:
+            return ['Unknown command.']
+
+        return []
+
+    def entries(self, kind, name):
+        """Return the entries of a map or an acl"""
+        if name in (MAP_FILE, ACL_FILE, LARGE_MAP_FILE):
+            index = 1 if name == LARGE_MAP_FILE else 0
+        else:
+            index = int(name.lstrip('#'))
+        store = self.maps if kind == 'map' else self.acls
+
+        return store[index]
+
+    def pattern(self, words):
+        # pylint: disable=too-many-return-statements
+        action, kind = words[:2]
+        if action == 'show' and len(words) == 2:
+            lines = ['# id (file) description',
+                     "0 ({}) pattern loaded from file '{}'".format(
+                         MAP_FILE if kind == 'map' else ACL_FILE,
+                         MAP_FILE if kind == 'map' else ACL_FILE)]
+            if kind == 'map':
+                lines.append("1 ({}) pattern loaded from file '{}'".format(
+                    LARGE_MAP_FILE, LARGE_MAP_FILE))
+            return lines
+        if action == 'prepare':
+            self.version += 1
+            self.versions[(kind, words[2], self.version)] = OrderedDict()
+            return ['New version created: {}'.format(self.version)]
+        if len(words) > 3 and words[2].startswith('@'):
+            key = (kind, words[3], int(words[2][1:]))
+            if key not in self.versions:
+                return ['Unknown version.']
+            if action == 'add':
+                self.versions[key][words[4]] = (words[5] if kind == 'map'
+                                                else None)
+            elif action in ('commit', 'clear'):
+                entries = self.versions.pop(key)
+                if action == 'commit':
+                    self.entries(kind, words[3]).clear()
+                    self.entries(kind, words[3]).update(entries)
+            return []
+
+        entries = self.entries(kind, words[2])
+        if action == 'show':
+            return ['0x{:x} {}'.format(x, key if value is None else
+                                       '{} {}'.format(key, value))
+                    for x, (key, value) in enumerate(entries.items())]
+        if action == 'get':
+            return self.lookup(kind, entries, words[3])
+        if action == 'add':
+            entries[words[3]] = words[4] if kind == 'map' else None
+        elif action == 'set':
+            if words[3] not in entries:
+                return ['entry not found.']
+            entries[words[3]] = words[4]
+        elif action == 'del':
+            entries.pop(words[3], None)
+        elif action == 'clear':
+            entries.clear()
+        else:
+            return ['Unknown command.']
+
+        return []
+
+    @staticmethod
+    def lookup(kind, entries, key):
+        if kind == 'acl':
+            if key in entries:
+                return ['type=beg, case=sensitive, match=yes, idx=tree, '
+                        'pattern="{}"'.format(key)]
+            return ['type=beg, case=sensitive, match=no']
+        if key in entries:
+            return ['type=str, case=sensitive, found=yes, idx=tree, '
+                    'key="{}", value="{}", type="str"'.format(key,
+                                                              entries[key])]
+
+        return ['type=str, case=sensitive, found=no']
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Serve a connection the way the stats socket of HAProxy does"""
+    def handle(self):
+        process = self.server.process
+        with process.lock:
+            process.connections += 1
+        prompt = False
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                with process.lock:
+                    process.lines += 1
+                for cmd in SEMICOLON.split(line.decode().strip()):
+                    cmd = cmd.strip().replace('\\;', ';')
+                    if cmd == 'prompt':
+                        prompt = not prompt
+                        self.wfile.write(b'\n> ' if prompt else b'')
+                        continue
+                    if cmd == 'quit':
+                        return
+                    output = ''.join(x + '\n' for x in process.handle(cmd))
+                    self.wfile.write(output.encode())
+                    self.wfile.write(b'\n> ' if prompt else b'\n')
+                self.wfile.flush()
+                if not prompt:
+                    return
+        except socket.error:
+            # The client closed the connection
+            return
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, process):
+        self.process = process
+        if os.path.exists(path):
+            os.unlink(path)
+        socketserver.UnixStreamServer.__init__(self, path, Handler)
+
+
+def start(directory, nbproc=2, latency=0, **config):
+    """Start a fake HAProxy process per socket file in a directory
+
+    Every process is served by a thread, they are stopped when the program
+    exits.
+
+    :param config: number of frontends, backends, servers, map_entries,
+      large_map_entries and acl_entries, see Process
+    :return: Process objects
+    :rtype: ``list``
+    """
+    defaults = {'frontends': 10, 'backends': 10, 'servers': 10,
+                'map_entries': 1000, 'large_map_entries': 300000,
+                'acl_entries': 1000}
+    defaults.update(config)
+    processes = []
+    for process_nb in range(1, nbproc + 1):
+        process = Process(process_nb, nbproc, defaults, latency)
+        server = Server(os.path.join(directory, 'process{}'.format(process_nb)),
+                        process)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        processes.append(process)
+
+    return processes
+
+
+def config(arguments):
+    """Return the arguments of start() from the arguments of the program"""
+    return {
+        'nbproc': int(arguments['--nbproc']),
+        'latency': float(arguments['--latency']),
+        'frontends': int(arguments['--frontends']),
+        'backends': int(arguments['--backends']),
+        'servers': int(arguments['--servers']),
+        'map_entries': int(arguments['--map-entries']),
+        'large_map_entries': int(arguments['--large-map-entries']),
+        'acl_entries': int(arguments['--acl-entries']),
+    }
+
+
+def main():
+    arguments = docopt(__doc__)
+    if not os.path.isdir(arguments['DIR']):
+        os.makedirs(arguments['DIR'])
+    start(arguments['DIR'], **config(arguments))
+    print("listening in {}".format(arguments['DIR']))
+    while True:
+        time.sleep(3600)
+
+# This is the standard boilerplate that calls the main() function.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Run benchmarks of haproxytool against a fake HAProxy
+
+Every benchmark runs haproxytool in a new process against the fake HAProxy
+of fakehap.py, which listens in a temporary directory, and records the wall
+time, the round trips to HAProxy, which are the lines HAProxy received, the
+connections, the peak RSS of haproxytool and its overhead, which is the wall
+time minus the time spent waiting for HAProxy as reported by --trace.
+
+Usage:
+    run.py [options] [BENCHMARK...]
+    run.py -l
+
+Arguments:
+    BENCHMARK  Name of a benchmark, all benchmarks are run when it isn't given
+
+Options:
+    -h, --help             show this screen
+    -l, --list             list benchmarks
+    -o, --options=OPTIONS  options of haproxytool before the command, such as
+                           '-k' or '--asyncio' [default: ]
+    -r, --repeat=N         times to run every benchmark, the fastest run is
+                           reported [default: 3]
+    -j, --json=FILE        save results to a file
+    -b, --baseline=FILE    compare results with a file saved with --json and
+                           exit with 1 if any benchmark got worse
+    -t, --tolerance=PERCENT  increase of wall time and peak RSS over the
+                           baseline which isn't reported [default: 20]
+    --budget=SECONDS       exit with 1 if the overhead of any benchmark is
+                           higher
+    --nbproc=N             number of HAProxy processes [default: 2]
+    --frontends=N          number of frontends [default: 10]
+    --backends=N           number of backends [default: 10]
+    --servers=N            number of servers per backend [default: 10]
+    --map-entries=N        number of entries of the map [default: 1000]
+    --acl-entries=N        number of patterns of the acl [default: 1000]
+    --large-map-entries=N  number of entries of the large map, which has
+                           ID 1 [default: 300000]
+    --latency=SECONDS      time HAProxy takes to process a command
+                           [default: 0]
+
+"""
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import shutil
+import tempfile
+import subprocess
+from collections import OrderedDict
+from docopt import docopt
+
+import fakehap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Times of phases in the report of --trace, such as 'socket 0.002s'
+PHASE_TIME = re.compile(r'(\w+) ([0-9.]+)s')
+# Options of haproxytool which print the report of --trace
+TRACE_OPTIONS = ('-T', '--trace', '--profile')
+
+# name: (description, arguments of haproxytool, standard input)
+# {map} is replaced with a file of entries which aren't in the map, {acl}
+# with a file of the patterns of the acl and {keys} with a file of keys, half
+# of them are found in the map.
+BENCHMARKS = OrderedDict([
+    ('dump', ("dump all frontends, backends and servers", ['dump'], None)),
+    ('server-show', ("show status of all servers", ['server', '-s'], None)),
+    ('server-show-live', ("show status of the servers of a backend with a "
+                          "command per value",
+                          ['server', '-s', '--live', '--backend=backend0'],
+                          None)),
+    ('server-drain', ("drain all servers", ['server', '-f', '-n'], None)),
+    ('server-ready', ("set all servers in normal mode", ['server', '-R'],
+                      None)),
+    ('server-weight', ("change weight of all servers", ['server', '-w', '2'],
+                       None)),
+    ('server-enable', ("enable a server, a short command which is mostly "
+                       "startup time",
+                       ['server', '-e', 'server0', '--backend=backend0'],
+                       None)),
+    ('map-show', ("show all entries of the map", ['map', '-s', '0'], None)),
+    ('map-show-large', ("show all entries of the large map, a single command "
+                        "with an output of several MB",
+                        ['map', '-s', '1'], None)),
+    ('map-lookup', ("look up many keys in the map", ['map', '-g', '0', '-'],
+                    '{keys}')),
+    ('map-import', ("add entries to the map", ['map', '-i', '0', '{map}'],
+                    None)),
+    ('map-replace', ("replace all entries of the map",
+                     ['map', '-r', '0', '{map}'], None)),
+    ('acl-check', ("check if many patterns are in the acl",
+                   ['acl', '-C', '0', '{acl}'], None)),
+])
+
+
+def write_files(directory, config):
+    """Create the input files of benchmarks and return their paths"""
+    files = {x: os.path.join(directory, x) for x in ('map', 'acl', 'keys')}
+    with open(files['map'], 'w') as file_handle:
+        for number in range(config['map_entries']):
+            file_handle.write("newkey{0} newvalue{0}\n".format(number))
+    with open(files['acl'], 'w') as file_handle:
+        for number in range(config['acl_entries']):
+            file_handle.write("/path{}\n".format(number))
+    with open(files['keys'], 'w') as file_handle:
+        for number in range(config['map_entries']):
+            file_handle.write("{}key{}\n".format('' if number % 2 else 'no',
+                                                 number))
+
+    return files
+
+
+def max_rss(rusage):
+    """Return peak RSS in MB, Linux reports it in KB and macOS in bytes"""
+    if sys.platform == 'darwin':
+        return rusage.ru_maxrss / 1024.0 / 1024
+
+    return rusage.ru_maxrss / 1024.0
+
+
+def overhead(wall, errors):
+    """Return the wall time minus the time spent waiting for HAProxy, which
+    is the time of connect and socket phases of the report of --trace"""
+    for line in errors.splitlines():
+        if line.startswith('# time '):
+            times = dict((x, float(y)) for x, y in PHASE_TIME.findall(line))
+            return max(0, wall - times.get('connect', 0) -
+                       times.get('socket', 0))
+
+    return None
+
+
+def measure(argv, stdin, processes):
+    """Run haproxytool once and return its measurements
+
+    :return: wall time, round trips, connections, peak RSS, overhead and exit
+      status
+    :rtype: ``dict``
+    """
+    for process in processes:
+        process.reset_counters()
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [x for x in [env.get('PYTHONPATH')] if x])
+    stdin = open(stdin if stdin is not None else os.devnull)
+    stderr = tempfile.TemporaryFile()
+    start = time.time()
+    try:
+        proc = subprocess.Popen(
+            [sys.executable, '-m', 'haproxytool.cli'] + argv, env=env,
+            stdin=stdin, stdout=open(os.devnull, 'w'), stderr=stderr)
+        # wait4() returns the resource usage of haproxytool alone
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.WEXITSTATUS(status)
+        elapsed = time.time() - start
+        stderr.seek(0)
+        errors = stderr.read().decode()
+    finally:
+        stdin.close()
+        stderr.close()
+
+    return {
+        'wall': elapsed,
+        'roundtrips': sum(x.lines for x in processes),
+        'connections': sum(x.connections for x in processes),
+        'rss': max_rss(rusage),
+        'overhead': overhead(elapsed, errors),
+        'status': proc.returncode,
+        'errors': errors,
+    }
+
+
+def run(name, arguments, socket_dir, files, processes):
+    """Run a benchmark the given number of times and return the fastest run"""
+    _, argv, stdin = BENCHMARKS[name]
+    options = shlex.split(arguments['--options'])
+    if not any(x.split('=')[0] in TRACE_OPTIONS for x in options):
+        options.append('--trace')
+    argv = (options + argv[:1] + ['-D', socket_dir] +
+            [x.format(**files) for x in argv[1:]])
+    if stdin is not None:
+        stdin = stdin.format(**files)
+    runs = [measure(argv, stdin, processes)
+            for _ in range(int(arguments['--repeat']))]
+    result = min(runs, key=lambda x: x['wall'])
+    result['rss'] = max(x['rss'] for x in runs)
+    overheads = [x['overhead'] for x in runs if x['overhead'] is not None]
+    result['overhead'] = min(overheads) if overheads else None
+
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return the benchmarks which got worse than the baseline"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        if result['roundtrips'] > before['roundtrips']:
+            regressions.append("{}: round trips {} -> {}".format(
+                name, before['roundtrips'], result['roundtrips']))
+        for key, title in (('wall', 'wall time'), ('rss', 'peak RSS')):
+            if result[key] > before[key] * (1 + tolerance / 100.0):
+                regressions.append("{}: {} {:.3f} -> {:.3f}".format(
+                    name, title, before[key], result[key]))
+
+    return regressions
+
+
+def main():
+    arguments = docopt(__doc__)
+    if arguments['--list']:
+        for name, (description, _, _) in BENCHMARKS.items():
+            print("{:<20} {}".format(name, description))
+        sys.exit(0)
+
+    names = arguments['BENCHMARK'] or list(BENCHMARKS)
+    unknown = [x for x in names if x not in BENCHMARKS]
+    if unknown:
+        sys.exit("unknown benchmarks: {}".format(' '.join(unknown)))
+    config = fakehap.config(arguments)
+    baseline = None
+    if arguments['--baseline'] is not None:
+        with open(arguments['--baseline']) as file_handle:
+            baseline = json.load(file_handle)
+        if baseline['config'] != config:
+            print("# baseline was taken with a different configuration: {}"
+                  .format(baseline['config']))
+
+    directory = tempfile.mkdtemp(prefix='haproxytool-bench')
+    try:
+        socket_dir = os.path.join(directory, 'sockets')
+        os.mkdir(socket_dir)
+        files = write_files(directory, config)
+        processes = fakehap.start(socket_dir, **config)
+        results = OrderedDict()
+        failed = 0
+        print("# {:<18} {:>10} {:>11} {:>12} {:>10} {:>12}".format(
+            'benchmark', 'wall(s)', 'roundtrips', 'connections', 'RSS(MB)',
+            'overhead(s)'))
+        for name in names:
+            result = run(name, arguments, socket_dir, files, processes)
+            print("{:<20} {:>10.3f} {:>11} {:>12} {:>10.1f} {:>12}".format(
+                name, result['wall'], result['roundtrips'],
+                result['connections'], result['rss'],
+                '-' if result['overhead'] is None else
+                "{:.3f}".format(result['overhead'])))
+            if result['status'] != 0:
+                failed += 1
+                print("{} failed with exit status {}: {}".format(
+                    name, result['status'], result.pop('errors').strip()))
+            result.pop('errors', None)
+            results[name] = result
+    finally:
+        shutil.rmtree(directory)
+
+    if arguments['--json'] is not None:
+        with open(arguments['--json'], 'w') as file_handle:
+            json.dump({'config': config, 'options': arguments['--options'],
+                       'results': results}, file_handle, indent=2)
+    if failed:
+        sys.exit("{} benchmarks failed".format(failed))
+    if arguments['--budget'] is not None:
+        over = [x for x, y in results.items()
+                if y['overhead'] is not None and
+                y['overhead'] > float(arguments['--budget'])]
+        if over:
+            sys.exit("overhead of {} is over the budget of {}s".format(
+                ', '.join(over), arguments['--budget']))
+    if baseline is not None:
+        regressions = compare(results, baseline['results'],
+                              float(arguments['--tolerance']))
+        for regression in regressions:
+            print(regression)
+        if regressions:
+            sys.exit("{} regressions against {}".format(
+                len(regressions), arguments['--baseline']))
+
+# This is the standard boilerplate that calls the main() function.
+if __name__ == '__main__':
+    main()
@@ -14,5 +14,8 @@ OUR_CMDS = [
     'dump',
     'haproxy',
     'map',
-    'acl'
+    'acl',
+    'batch',
+    'top',
+    'export',
 ]
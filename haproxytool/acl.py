@@ -10,10 +10,12 @@ Usage:
     haproxytool acl [-D DIR | -F SOCKET] (-c | -s) ACLID
     haproxytool acl [-D DIR | -F SOCKET] (-A | -g ) ACLID VALUE
     haproxytool acl [-D DIR | -F SOCKET] -d ACLID KEY
+    haproxytool acl [-D DIR | -F SOCKET] (-i | -C | -r) ACLID FILE
 
 
 Arguments:
     DIR     Directory path with socket files
+    FILE    File with a pattern per line, use '-' for standard input
     ACLID   ID of the acl or file returned by show acl
     SOCKET  Socket file
     VALUE   Value to set
@@ -25,8 +27,14 @@ Options:
     -F SOCKET, --file SOCKET  socket file
     -s, --show                show acl
     -g, --get                 lookup the value of a key in the acl
+    -i, --import              add patterns of <FILE> which aren't in the acl
+                              <ACLID>
     -c, --clear               clear all entries for a acl
+    -C, --check               show patterns of <FILE> which aren't in the acl
+                              <ACLID>
     -l, --list                list all acl ids
+    -r, --replace             replace all entries of the acl <ACLID> with the
+                              patterns of <FILE> in one step
     -d, --delete              delete all the acl entries from the acl <ACLID>
                               corresponding to the key <KEY>
     -D DIR, --socket-dir=DIR  directory with HAProxy socket files
@@ -34,8 +42,10 @@ Options:
 
 """
 import sys
-from docopt import docopt
-from haproxyadmin.exceptions import CommandFailed
+from haproxyadmin.exceptions import CommandFailed, HAProxyBaseError
+from .bulk import (VERSION, Progress, check_target, escape, open_file,
+                   read_acl, replace, send, target)
+from .usage import docopt
 from .utils import get_arg_option, haproxy_object
 
 
@@ -100,6 +110,72 @@ class AclCommand(object):
         except (CommandFailed, ValueError) as error:
             sys.exit(error)
 
+    def replace(self):
+        aclid = target(self.args['ACLID'])
+        progress = Progress('loaded')
+        try:
+            check_target(self.hap.show_acl(), aclid)
+            with open_file(self.args['FILE']) as file_handle:
+                replace(self.hap, 'acl', aclid,
+                        (("line {}".format(number),
+                          "add acl {} {} {}".format(VERSION, aclid,
+                                                    escape(pattern)))
+                         for number, pattern in read_acl(file_handle)),
+                        progress)
+        except (HAProxyBaseError, IOError, OSError, ValueError) as error:
+            print(progress.summary())
+            sys.exit(error)
+        print(progress.summary())
+        print("acl was replaced successfully")
+
+    def patterns(self):
+        """Return the patterns of the acl as a set"""
+        return set(x.split(' ', 1)[1]
+                   for x in self.hap.show_acl(aclid=self.args['ACLID']))
+
+    def import_(self):
+        aclid = target(self.args['ACLID'])
+        progress = Progress('added')
+
+        def build(file_handle, patterns):
+            for number, pattern in read_acl(file_handle):
+                if pattern in patterns:
+                    progress.skipped += 1
+                    continue
+                patterns.add(pattern)
+                yield ("line {}".format(number),
+                       "add acl {} {}".format(aclid, escape(pattern)))
+
+        try:
+            check_target(self.hap.show_acl(), aclid)
+            patterns = self.patterns()
+            with open_file(self.args['FILE']) as file_handle:
+                send(self.hap, build(file_handle, patterns), progress)
+        except (HAProxyBaseError, IOError, OSError, ValueError) as error:
+            sys.exit(error)
+        print(progress.summary())
+        if progress.failed:
+            sys.exit(1)
+
+    def check(self):
+        found = 0
+        missing = 0
+        try:
+            check_target(self.hap.show_acl(), target(self.args['ACLID']))
+            patterns = self.patterns()
+            with open_file(self.args['FILE']) as file_handle:
+                for _, pattern in read_acl(file_handle):
+                    if pattern in patterns:
+                        found += 1
+                    else:
+                        missing += 1
+                        print(pattern)
+        except (HAProxyBaseError, IOError, OSError, ValueError) as error:
+            sys.exit(error)
+        sys.stderr.write("# {} found, {} not found\n".format(found, missing))
+        if missing:
+            sys.exit(1)
+
 
 def main():
     arguments = docopt(__doc__)
@@ -107,7 +183,8 @@ def main():
 
     cmd = AclCommand(hap, arguments)
     method = get_arg_option(arguments)
-    getattr(cmd, method)()
+    # Methods named after a keyword of Python have a trailing underscore
+    (getattr(cmd, method + '_', None) or getattr(cmd, method))()
 
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
@@ -0,0 +1,88 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Send commands to HAProxy stats sockets with asyncio
+
+All commands are sent concurrently, while the number of commands in flight
+for a single socket is bounded, as HAProxy accepts a limited number of
+connections on its stats socket (see 'stats maxconn').
+
+Only commands sent with runtime.HAProxy.commands() go through asyncio. Reads
+of haproxyadmin objects, such as metrics, block and use a thread per HAProxy
+process, see runtime.HAProxy.map().
+"""
+import time
+import socket
+import asyncio
+from haproxyadmin.exceptions import SocketConnectionError, SocketTimeout
+
+from .runtime import socket_address
+
+# Default number of commands in flight per socket
+LIMIT = 4
+
+
+async def send(socket_file, cmd, semaphore, timeout, tracer=None):
+    """Send a command to a socket and return its output as a list of lines"""
+    async with semaphore:
+        start = time.time()
+        try:
+            family, address = socket_address(socket_file)
+            if family == socket.AF_UNIX:
+                connection = asyncio.open_unix_connection(address)
+            else:
+                connection = asyncio.open_connection(*address)
+            reader, writer = await asyncio.wait_for(connection, timeout)
+        except asyncio.TimeoutError:
+            raise SocketTimeout(socket_file=socket_file)
+        except OSError:
+            raise SocketConnectionError(socket_file)
+
+        chunks = []
+        try:
+            writer.write((cmd + '\n').encode())
+            # HAProxy closes the connection after it sends the output
+            while True:
+                chunk = await asyncio.wait_for(reader.read(65536), timeout)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        except asyncio.TimeoutError:
+            raise SocketTimeout(socket_file=socket_file)
+        finally:
+            writer.close()
+        if tracer is not None:
+            tracer.record(socket_file, [cmd], len(cmd) + 1,
+                          sum(len(x) for x in chunks), start)
+
+    return b''.join(chunks).decode().splitlines()
+
+
+def run(jobs, limit=LIMIT, timeout=1, tracer=None):
+    """Send commands to sockets concurrently
+
+    :param jobs: list of 2-item tuple, socket file and command
+    :type jobs: ``list``
+    :param limit: maximum number of commands in flight per socket
+    :type limit: ``int``
+    :param timeout: timeout for connect and every read, in seconds
+    :type timeout: ``float``
+    :param tracer: A trace.Tracer which records every command sent
+    :return: output of every job as a list of lines, in the order of jobs
+    :rtype: ``list``
+    """
+    async def gather():
+        semaphores = {}
+        for socket_file, _ in jobs:
+            if socket_file not in semaphores:
+                semaphores[socket_file] = asyncio.Semaphore(limit)
+
+        return await asyncio.gather(
+            *[send(socket_file, cmd, semaphores[socket_file], timeout,
+                   tracer) for socket_file, cmd in jobs])
+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(gather())
+    finally:
+        loop.close()
@@ -4,14 +4,22 @@
 """Manage backends
 
 Usage:
-    haproxytool backend [-D DIR | -F SOCKET] (-S | -r | -p | -s | -i) [NAME...]
+    haproxytool backend [-D DIR | -F SOCKET] (-S | -r | -p | -s | -i)
+                        [--where=EXPR] [NAME...]
     haproxytool backend [-D DIR | -F SOCKET] (-l | -M)
-    haproxytool backend [-D DIR | -F SOCKET] -m METRIC [NAME...]
+    haproxytool backend [-D DIR | -F SOCKET] -m METRIC [--where=EXPR]
+                        [NAME...]
+    haproxytool backend [-D DIR | -F SOCKET] (--top | --bottom) METRIC [N]
+                        [--where=EXPR]
 
 Arguments:
     DIR     Directory path with socket files
     SOCKET  Socket file
     METRIC  Name of a metric, use '-M' to get metric names
+    N       Number of backends to show, 10 by default
+    EXPR    Comparisons of fields of statistics with values, combined with
+            and, or, not and parentheses, such as 'status==DOWN and
+            scur>100', see 'haproxytool.where' for the syntax
 
 Options:
     -F SOCKET, --file SOCKET  socket file
@@ -24,15 +32,22 @@ Options:
     -r, --requests            show requests
     -s, --status              show status
     -S, --servers             show servers
+    --top                     show backends with the largest value of a metric
+    --bottom                  show backends with the smallest value of a
+                              metric
+    --where=EXPR              select only backends whose statistics match
+                              EXPR
     -D DIR, --socket-dir=DIR  directory with HAProxy socket files
                               [default: /var/lib/haproxy]
 
 """
 import sys
-from docopt import docopt
 from haproxyadmin import BACKEND_METRICS
 
-from .utils import get_arg_option, haproxy_object
+from .output import note, write
+from .usage import docopt
+from .utils import (GLOBAL_OPTIONS, get_arg_option, haproxy_object,
+                    positive_number)
 
 
 class BackendCommand():
@@ -42,56 +57,91 @@ class BackendCommand():
         hap (object): A haproxy.HAProxy object
         args (dict): A dictionary returned by docopt afte CLI is parsed
     """
+    # Methods which need only names, IDs and process numbers of backends,
+    # which are read from the topology cache when it is enabled
+    TOPOLOGY_METHODS = [
+        'show',
+        'iid',
+        'process',
+        'servers',
+    ]
+    # Methods which read metrics of all backends from a single snapshot
+    SNAPSHOT_METHODS = [
+        'top',
+        'bottom',
+    ]
+
     def __init__(self, hap, args):
+        # Imported only here, usage and help of the command don't need it
+        from .snapshot import Snapshot
         self.hap = hap
         self.args = args
+        self.stats = hap
+        method = get_arg_option(args)
+        if (GLOBAL_OPTIONS['--cache'] and method in self.TOPOLOGY_METHODS
+                and args['--where'] is None):
+            from .cache import topology
+            self.stats = topology(hap)
+        elif method in self.SNAPSHOT_METHODS:
+            self.stats = Snapshot(hap)
         self.backends = self.build_backend_list(args['NAME'])
+        if args['--where'] is not None:
+            stats = self.stats
+            if not isinstance(stats, Snapshot):
+                stats = Snapshot(hap)
+            from .where import where
+            try:
+                self.backends = where(args['--where'], self.backends,
+                                      stats.backends(), lambda x: x.name)
+            except ValueError as error:
+                sys.exit(error)
 
     def build_backend_list(self, names=None):
         backends = []
         if not names:
-            for backend in self.hap.backends():
+            for backend in self.stats.backends():
                 backends.append(backend)
         else:
             for name in names:
                 try:
-                    backends.append(self.hap.backend(name))
+                    backends.append(self.stats.backend(name))
                 except ValueError:
-                    print("{} was not found".format(name))
+                    note("{} was not found".format(name))
 
         return backends
 
+    def write_backends(self, column, value, line=None):
+        "write name and a value of every backend"
+        write(('backendname', column),
+              ((x.name, value(x)) for x in self.backends), line)
+
     def show(self):
         "report backend name"
-        for backend in self.backends:
-            print("{}".format(backend.name))
+        write(('backendname',), ((x.name,) for x in self.backends))
 
     def status(self):
         "report status of backends"
-        for backend in self.backends:
-            print("{} {}".format(backend.name, backend.status))
+        self.write_backends('status', lambda x: x.status)
 
     def requests(self):
         "report traffic for backends"
-        for backend in self.backends:
-            print("{} {}".format(backend.name, backend.requests))
+        self.write_backends('requests', lambda x: x.requests)
 
     def iid(self):
         "report proxy iid of backends"
-        for backend in self.backends:
-            print("{} {}".format(backend.name, backend.iid))
+        self.write_backends('iid', lambda x: x.iid)
 
     def process(self):
         "report which HAProxy process manage which backends"
-        for backend in self.backends:
-            print("{} {}".format(backend.name, backend.process_nb))
+        self.write_backends('process_nb', lambda x: x.process_nb)
 
     def servers(self):
         "report backend memberhips"
-        for backend in self.backends:
-            print("{}".format(backend.name))
-            for server in backend.servers():
-                print("{:<3} {}".format(' ', server.name))
+        self.write_backends('servers',
+                            lambda x: [y.name for y in x.servers()],
+                            line=lambda x: '\n'.join(
+                                [x[0]] + ["{:<3} {}".format(' ', y)
+                                          for y in x[1]]))
 
     def metric(self):
         "report value of a metric"
@@ -99,13 +149,29 @@ class BackendCommand():
         if metric not in BACKEND_METRICS:
             sys.exit("{} no valid metric".format(metric))
 
-        for backend in self.backends:
-            print("{} {}".format(backend.name, backend.metric(metric)))
+        self.write_backends(metric, lambda x: x.metric(metric))
+
+    def top(self):
+        "report backends with the largest value of a metric"
+        self.ranking(largest=True)
+
+    def bottom(self):
+        "report backends with the smallest value of a metric"
+        self.ranking(largest=False)
+
+    def ranking(self, largest):
+        metric = self.args['METRIC']
+        if metric not in BACKEND_METRICS:
+            sys.exit("{} no valid metric".format(metric))
+
+        from .snapshot import rank
+        ranked = rank(self.backends, metric,
+                      positive_number(self.args, 'N', 10), largest)
+        write(('backendname', metric), ((x.name, value) for value, x in ranked))
 
     def showmetrics(self):
         "report all valid metrics for a backend"
-        for metric in BACKEND_METRICS:
-            print(metric)
+        write(('metric',), ((x,) for x in BACKEND_METRICS))
 
 
 def main():
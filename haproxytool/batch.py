@@ -0,0 +1,141 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Run many operations from a file
+
+Usage:
+    haproxytool batch [-D DIR | -F SOCKET] [-e] [FILE]
+
+Arguments:
+    DIR     Directory path with socket files
+    SOCKET  Socket file
+    FILE    File with an operation per line, such as 'server -e NAME',
+            standard input is read when it is '-' or it isn't given
+
+Options:
+    -e, --exit-on-error       stop at the first operation which fails
+    -F SOCKET, --file SOCKET  socket file
+    -h, --help                show this screen
+    -D DIR, --socket-dir=DIR  directory with HAProxy socket files
+                              [default: /var/lib/haproxy]
+
+"""
+import os
+import sys
+import shlex
+from importlib import import_module
+from docopt import DocoptExit
+from haproxyadmin.exceptions import HAProxyBaseError
+
+from haproxytool import OUR_CMDS
+from .usage import docopt
+from .utils import GLOBAL_OPTIONS
+
+# Options of an operation which select the HAProxy processes
+SOCKET_OPTIONS = ('-D', '-F', '--socket-dir', '--file')
+
+
+def read_operations(path):
+    """Return a list of (line number, line) for all operations in a file
+
+    Empty lines and comments, lines which start with '#', are skipped.
+    """
+    if path is None or path == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(path) as file_handle:
+            lines = file_handle.readlines()
+
+    return [(number, line.strip()) for number, line in enumerate(lines, 1)
+            if line.strip() and not line.strip().startswith('#')]
+
+
+def socket_args(arguments):
+    """Return the options which select HAProxy processes for all operations"""
+    if arguments['--file'] is not None:
+        return ['--file', arguments['--file']]
+
+    return ['--socket-dir', arguments['--socket-dir']]
+
+
+def build_argv(line, default_socket_args):
+    """Return the arguments of an operation as they are passed to haproxytool
+
+    The operation uses the HAProxy processes of batch command, unless it
+    selects them with its own options.
+    """
+    words = shlex.split(line)
+    if not words or words[0] not in OUR_CMDS or words[0] == 'batch':
+        raise ValueError("{} isn't a haproxytool command".format(
+            words[0] if words else line))
+    for word in words[1:]:
+        if word.split('=')[0] in SOCKET_OPTIONS or word[:2] in ('-D', '-F'):
+            return words
+
+    return words[:1] + default_socket_args + words[1:]
+
+
+def run(argv):
+    """Run an operation
+
+    :return: ``None`` if the operation was successful otherwise the error
+    :rtype: ``str``
+    """
+    sys.argv = [sys.argv[0]] + argv
+    sub_cmd = import_module('haproxytool.{}'.format(argv[0]))
+    try:
+        sub_cmd.main()
+    except DocoptExit:
+        return "invalid arguments, see 'haproxytool help {}'".format(argv[0])
+    except SystemExit as exc:
+        if exc.code is None or exc.code == 0:
+            return None
+        if isinstance(exc.code, int):
+            return "exit status {}".format(exc.code)
+        return "{}".format(exc.code)
+    except EOFError:
+        # Standard input is closed, we can't ask the user for confirmation
+        return "operation needs confirmation, use --force"
+    except HAProxyBaseError as exc:
+        return "{}".format(exc)
+    except Exception as exc:  # pylint: disable=broad-except
+        # A bug in one operation shouldn't stop the rest of them
+        return "unexpected error {}: {}".format(type(exc).__name__, exc)
+
+    return None
+
+
+def main():
+    arguments = docopt(__doc__)
+    # All operations run over the same connections to HAProxy processes,
+    # commands of an operation are sent in a single line per process.
+    if not GLOBAL_OPTIONS['--asyncio']:
+        GLOBAL_OPTIONS['--persistent'] = True
+
+    try:
+        operations = read_operations(arguments['FILE'])
+    except (IOError, OSError) as error:
+        sys.exit(error)
+    # Operations can't ask the user for confirmation, see run()
+    sys.stdin = open(os.devnull)
+    default_socket_args = socket_args(arguments)
+    failed = 0
+    for number, line in operations:
+        try:
+            error = run(build_argv(line, default_socket_args))
+        except ValueError as exc:
+            error = "{}".format(exc)
+        if error is None:
+            print("# line {} OK: {}".format(number, line))
+        else:
+            failed += 1
+            print("# line {} FAILED: {}: {}".format(number, line, error))
+        if error is not None and arguments['--exit-on-error']:
+            break
+
+    if failed:
+        sys.exit("{} of {} operations failed".format(failed, len(operations)))
+
+# This is the standard boilerplate that calls the main() function.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Send commands for many map and acl entries
+
+Entries are read from a file one chunk at a time and the commands for a chunk
+are sent to every HAProxy process over a single connection, separated by a
+semicolon. Memory usage depends on the size of a chunk and not on the size of
+the file.
+"""
+import sys
+import time
+from itertools import islice
+from haproxyadmin.exceptions import CommandFailed, MultipleCommandResults
+from haproxyadmin.utils import check_command, isint
+
+# Number of entries which are read and sent at once
+CHUNK_SIZE = 1000
+# Placeholder for the version of a map or acl in commands, see replace()
+VERSION = '@VERSION'
+
+
+def target(name):
+    """Return how a map or an acl is referred to in a command
+
+    :param name: ID of a map or acl, or its file
+    :type name: ``str``
+    """
+    if isint(name):
+        return "#{}".format(name)
+
+    return name
+
+
+def check_target(listing, name):
+    """Check if a map or an acl is in the output of show map/acl command
+
+    :param listing: output of show map or show acl without arguments
+    :type listing: ``list``
+    :param name: a map or an acl as returned by target()
+    :type name: ``str``
+    :raise: ValueError when it isn't found
+    """
+    for line in listing:
+        parts = line.split()
+        if not parts or line.startswith('#'):
+            continue
+        if name == "#{}".format(parts[0]):
+            return
+        if len(parts) > 1 and name == parts[1].strip('()'):
+            return
+
+    raise ValueError("{} was not found".format(name))
+
+
+def escape(value):
+    """Escape characters which HAProxy uses to split commands and arguments"""
+    for char in ('\\', ' ', ';'):
+        value = value.replace(char, '\\' + char)
+
+    return value
+
+
+def open_file(path):
+    """Return a file object for a path, '-' is standard input"""
+    if path == '-':
+        return sys.stdin
+
+    return open(path)
+
+
+def read_map(file_handle):
+    """Yield (line number, key, value) for every entry of a map file
+
+    The format is the same as the one of map files used by HAProxy, key and
+    value separated by spaces, empty lines and comments are skipped. Value is
+    ``None`` when a line has only a key.
+    """
+    for number, line in enumerate(file_handle, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(None, 1)
+        yield number, parts[0], parts[1] if len(parts) == 2 else None
+
+
+def read_acl(file_handle):
+    """Yield (line number, pattern) for every entry of an acl file
+
+    Empty lines and comments are skipped.
+    """
+    for number, line in enumerate(file_handle, 1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield number, line
+
+
+def parse_entry(line):
+    """Return (reference, key, value) for an entry of show map output
+
+    Value is an empty string for entries of an acl.
+    """
+    parts = line.split(' ', 2)
+    if len(parts) < 2:
+        raise ValueError("unexpected entry: {}".format(line))
+
+    return parts[0], parts[1], parts[2] if len(parts) == 3 else ''
+
+
+def chunks(entries, size=CHUNK_SIZE):
+    """Yield lists of up to size entries"""
+    entries = iter(entries)
+    while True:
+        chunk = list(islice(entries, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Progress(object):
+    """Report how many entries have been processed and how fast
+
+    Argument:
+        action (str): What happens to entries, used in the messages
+        stream (object): A file object to write progress to
+    """
+    def __init__(self, action, stream=sys.stderr):
+        self.action = action
+        self.stream = stream
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self.start = time.time()
+
+    @property
+    def rate(self):
+        elapsed = time.time() - self.start
+        if elapsed == 0:
+            return 0
+
+        return self.done / elapsed
+
+    def error(self, msg):
+        """Report an entry which wasn't sent to HAProxy"""
+        self.failed += 1
+        print(msg)
+
+    def update(self, done, failed):
+        self.done += done
+        self.failed += failed
+        self.stream.write("# {} {} entries, {}{} failed, {:.0f} entries/s\n"
+                          .format(self.action, self.done, self.counts(),
+                                  self.failed, self.rate))
+        self.stream.flush()
+
+    def counts(self):
+        if not self.skipped:
+            return ''
+
+        return "{} skipped, ".format(self.skipped)
+
+    def summary(self):
+        return ("{} {} entries, {}{} failed in {:.2f} seconds, "
+                "{:.0f} entries/s".format(self.action, self.done,
+                                          self.counts(), self.failed,
+                                          time.time() - self.start, self.rate))
+
+
+def send(hap, cmds, progress, versions=None):
+    """Send commands to all HAProxy processes and report the ones which failed
+
+    :param hap: A runtime.HAProxy object
+    :param cmds: iterable of 2-item tuple, where the entry of the command was
+      found, which is printed when it fails, and the command
+    :param progress: A Progress object which is updated after every chunk
+    :param versions: version of a map or acl per process number, which
+      replaces the 1st VERSION of a command, see prepare()
+    :type versions: ``dict``
+    """
+    for chunk in chunks(cmds):
+        failed = 0
+        if versions is None:
+            results = hap.commands([(cmd, None) for _, cmd in chunk],
+                                   pipeline=True)
+        else:
+            # Versions are different per process, a command per process
+            results = hap.commands(
+                [(cmd.replace(VERSION, "@{}".format(version), 1), [nb])
+                 for _, cmd in chunk for nb, version in versions.items()],
+                pipeline=True)
+            results = [sum(results[i:i + len(versions)], [])
+                       for i in range(0, len(results), len(versions))]
+        for (where, cmd), result in zip(chunk, results):
+            try:
+                check_command(result)
+            except CommandFailed as error:
+                failed += 1
+                print("{}: {} failed:{}".format(where, cmd, error))
+            except MultipleCommandResults as error:
+                failed += 1
+                print("{}: {} failed with different results per "
+                      "process:{}".format(where, cmd, error.results))
+        progress.update(len(chunk) - failed, failed)
+
+
+def prepare(hap, kind, name):
+    """Create a new empty version of a map or an acl in all processes
+
+    Entries are added to the new version with 'add map @<version> ...' and
+    it is used only after it is committed, see replace().
+
+    :param kind: either map or acl
+    :type kind: ``str``
+    :return: version per process number
+    :rtype: ``dict``
+    :raise: CommandFailed when HAProxy doesn't support versions
+    """
+    versions = {}
+    for process_nb, output in hap.run("prepare {} {}".format(kind, name)):
+        # New version created: 2
+        if not output.startswith('New version created:'):
+            raise CommandFailed(output)
+        versions[process_nb] = int(output.split(':')[1])
+
+    return versions
+
+
+def replace(hap, kind, name, cmds, progress):
+    """Replace all entries of a map or an acl in one step
+
+    A new version is loaded with the commands, which must refer to the
+    version as VERSION, and it is committed only if no entry failed.
+
+    :param kind: either map or acl
+    :type kind: ``str``
+    :raise: CommandFailed when the new version wasn't committed
+    """
+    versions = prepare(hap, kind, name)
+    send(hap, cmds, progress, versions)
+    if progress.failed:
+        # Free the memory used by the new version
+        hap.commands([("clear {} @{} {}".format(kind, version, name), [nb])
+                      for nb, version in versions.items()], pipeline=True)
+        raise CommandFailed("{} wasn't changed as {} entries failed"
+                            .format(name, progress.failed))
+
+    results = hap.commands([("commit {} @{} {}".format(kind, version, name),
+                             [nb]) for nb, version in versions.items()],
+                           pipeline=True)
+    for result in results:
+        check_command(result)
@@ -0,0 +1,125 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Cache the names of frontends, backends and servers across runs
+
+Names of frontends, backends and servers, their IDs and the processes they
+are in change only when HAProxy is restarted or reloaded. They are saved in a
+file under $XDG_CACHE_HOME/haproxytool, per set of socket files, together
+with the process ID and start time of every HAProxy process. A file is used
+only when all processes are the same, which is checked with the output of
+'show info' that is read anyway when HAProxy processes are discovered, so a
+valid cache saves the 'show stat' of every process.
+
+Servers which are added or removed at runtime aren't noticed, the cache is
+used only when it is enabled with '--cache'.
+"""
+import os
+import json
+import hashlib
+
+from .snapshot import Snapshot, _fields
+
+# Fields of 'show stat' which are saved
+FIELDS = ('pxname', 'svname', 'iid', 'sid')
+# Difference in seconds between start times which is accepted as the same, as
+# start time is calculated from uptime in seconds
+START_TIME_SLACK = 2
+
+
+def cache_dir():
+    """Return the directory of cache files"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+
+    return os.path.join(base, 'haproxytool')
+
+
+def cache_file(hap):
+    """Return the cache file for the socket files of HAProxy processes"""
+    key = '\n'.join(sorted(x[0] for x in hap.identity()))
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    return os.path.join(cache_dir(), "topology-{}.json".format(digest))
+
+
+def same_processes(cached, current):
+    """Check if processes in the cache are the running ones"""
+    if len(cached) != len(current):
+        return False
+    for old, new in zip(sorted(cached), sorted(current)):
+        if (old[:3] != new[:3] or
+                abs(old[3] - new[3]) > START_TIME_SLACK):
+            return False
+
+    return True
+
+
+def strip(csv_data):
+    """Return the output of 'show stat' with only the fields which are saved
+    """
+    if not csv_data or not csv_data[0].startswith('#'):
+        # Snapshot reports the error
+        return csv_data
+    fields = _fields(csv_data[0])
+    lines = ["# {},".format(','.join(FIELDS))]
+    for line in csv_data[1:]:
+        if line:
+            parts = line.split(',')
+            lines.append(','.join(parts[fields[x]] for x in FIELDS))
+
+    return lines
+
+
+def load(path, identity):
+    """Return the saved output of 'show stat' if the processes are the same
+
+    :return: ``None`` when the file doesn't exist, can't be read or HAProxy
+      processes are different
+    """
+    try:
+        with open(path) as file_handle:
+            data = json.load(file_handle)
+        if same_processes(data['processes'], identity):
+            return data['stats']
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        pass
+
+    return None
+
+
+def save(path, identity, stats):
+    """Save the output of 'show stat', errors are ignored as the file is
+    only an optimization"""
+    # Imported only here, as it is needed only when the cache is updated
+    import tempfile
+    try:
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        # Write to a temporary file and rename it, so readers never see a
+        # partial file
+        handle, tmp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(handle, 'w') as file_handle:
+            json.dump({'processes': identity, 'stats': stats}, file_handle)
+        os.rename(tmp_path, path)
+    except (IOError, OSError):
+        pass
+
+
+def topology(hap):
+    """Return a Snapshot with names, IDs and process numbers of objects
+
+    It is built from the cache when it is valid, otherwise from 'show stat'
+    and the cache is updated. Metrics of the objects aren't available.
+    """
+    identity = hap.identity()
+    path = cache_file(hap)
+    stats = load(path, identity)
+    if stats is None:
+        stats = [(process_nb, strip(csv_data))
+                 for process_nb, csv_data in hap.command('show stat')]
+        if all(x[1] and x[1][0].startswith('#') for x in stats):
+            save(path, identity, stats)
+
+    return Snapshot(hap, stats)
@@ -1,11 +1,42 @@
 # vim:fenc=utf-8
 """A tool to manage HAProxy via the stats socket.
 
-Usage: haproxytool [-v | -h] <command> [<args>...]
+Usage: haproxytool [-v | -h] [-P N] [--asyncio] [-k] [-T] [--profile FILE]
+                   [--cache] [--output FORMAT]
+                   [--targets FILE [--workers N] [--target-timeout SECONDS]]
+                   <command> [<args>...]
 
 Options:
   -h, --help                show this screen.
   -v, --version             show version.
+  -P N, --parallel N        send each command to all HAProxy processes at
+                            once using N workers
+  --asyncio                 send commands concurrently with asyncio, a
+                            command per object also for changes of many
+                            objects, the number of commands in flight per
+                            HAProxy process is set by --parallel and it is 4
+                            by default, reads with --live and of the haproxy
+                            command use a thread per HAProxy process instead,
+                            it requires Python 3.5 or higher
+  -k, --persistent          keep one connection open per HAProxy process in
+                            interactive mode for all commands
+  -T, --trace               print the number and latency of commands sent to
+                            HAProxy and the time per phase to stderr at exit
+  --profile FILE            same as --trace and save every command sent to
+                            HAProxy to FILE in JSON
+  --cache                   keep names of frontends, backends and servers in
+                            a file under $XDG_CACHE_HOME until HAProxy is
+                            restarted or reloaded
+  --output FORMAT           format of the output of commands which show
+                            frontends, backends or servers, table, csv, json
+                            or ndjson [default: table]
+  --targets FILE            run the command against every HAProxy listed in
+                            FILE, a socket file, a directory or
+                            ipv4@<host>:<port> per line
+  --workers N               number of targets to run the command against at
+                            once [default: 10]
+  --target-timeout SECONDS  seconds to wait for the command against a
+                            target before it is stopped [default: 60]
 
 Available haproxytool commands:
     haproxy   HAProxy operations
@@ -15,6 +46,9 @@ Available haproxytool commands:
     dump      Dumps all informations
     map       Manage MAPs
     acl       Manage ACLs
+    batch     Run many operations from a file
+    top       Show live rates of frontends, backends or servers
+    export    Export metrics in the OpenMetrics format
 
 See 'haproxytool help <command>' for more information on a specific command.
 
@@ -22,9 +56,9 @@ See 'haproxytool help <command>' for more information on a specific command.
 import sys
 from operator import methodcaller
 from importlib import import_module
-from docopt import docopt
 from haproxytool import __version__
 from haproxytool import OUR_CMDS
+from haproxytool.usage import docopt
 from haproxyadmin import __version__ as hapadmin_version
 
 
@@ -34,23 +68,64 @@ def main():
     """
     version = ("haproxytool version: {}, haproxyadmin library version: {}"
                .format(__version__, hapadmin_version))
-    args = docopt(__doc__, version=version, options_first=True)
+    argv = sys.argv[1:]
+    args = docopt(__doc__, argv=argv, version=version, options_first=True)
+    # Imported only after usage and version are handled, they aren't needed
+    # for them
+    from haproxytool.output import FORMATS
+    from haproxytool.utils import GLOBAL_OPTIONS
+
+    for option in ('--parallel', '--workers'):
+        if args[option] is None:
+            continue
+        try:
+            args[option] = int(args[option])
+            if args[option] < 1:
+                raise ValueError
+        except ValueError:
+            sys.exit("{} expects a positive number, got {}"
+                     .format(option, args[option]))
+    if args['--output'] not in FORMATS:
+        sys.exit("--output expects one of {}, got {}".format(
+            ', '.join(FORMATS), args['--output']))
+    if args['--asyncio'] and sys.version_info < (3, 5):
+        sys.exit("--asyncio requires Python 3.5 or higher")
+    for option in GLOBAL_OPTIONS:
+        GLOBAL_OPTIONS[option] = args[option]
+    # Subcommands parse sys.argv with their own usage, which doesn't know
+    # about the options given before the command.
+    sys.argv = [sys.argv[0], args['<command>']] + args['<args>']
+
+    if args['--targets'] is not None and args['<command>'] in OUR_CMDS:
+        # Imported only here, as multiprocessing takes long to import
+        from haproxytool import fleet
+        fleet.main(args, argv)
+        return
 
     call_main = methodcaller('main')
+    tracer = None
+    if args['--trace'] or args['--profile'] is not None:
+        from haproxytool import trace
+        tracer = trace.TRACER = trace.Tracer()
 
-    if args['<command>'] in OUR_CMDS:
-        sub_cmd = import_module('haproxytool.%s' % args['<command>'])
-        call_main(sub_cmd)
-    elif args['<command>'] == 'help':
-        if len(args['<args>']) == 1 and args['<args>'][0] in OUR_CMDS:
-            sub_cmd = import_module('haproxytool.%s' % args['<args>'][0])
+    try:
+        if args['<command>'] in OUR_CMDS:
+            sub_cmd = import_module('haproxytool.%s' % args['<command>'])
             call_main(sub_cmd)
+        elif args['<command>'] == 'help':
+            if len(args['<args>']) == 1 and args['<args>'][0] in OUR_CMDS:
+                sub_cmd = import_module('haproxytool.%s' % args['<args>'][0])
+                call_main(sub_cmd)
+            else:
+                msg = "use any of {c} in help command".format(
+                    c=','.join(OUR_CMDS))
+                sys.exit(msg)
         else:
-            msg = "use any of {c} in help command".format(c=','.join(OUR_CMDS))
-            sys.exit(msg)
-    else:
-        sys.exit("<{}> isn't a haproxytool command. See 'haproxytool --help'."
-                 .format(args['<command>']))
+            sys.exit("<{}> isn't a haproxytool command. See "
+                     "'haproxytool --help'.".format(args['<command>']))
+    finally:
+        if tracer is not None:
+            tracer.report(args['--profile'])
 
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
@@ -18,58 +18,82 @@ Options:
                               [default: /var/lib/haproxy]
 
 """
-from docopt import docopt
+import sys
 
+from .output import Writer
+from .snapshot import Snapshot
+from .usage import docopt
 from .utils import haproxy_object
 
 
-def get_backends(hap):
-    print("# backend name, status, requests, servers")
-    for backend in hap.backends():
-        servers = ','.join([x.name for x in backend.servers()])
-        print("{},{},{},{}".format(backend.name, backend.status,
-                                   backend.requests, servers))
+def backends(snapshot):
+    return (('name', 'status', 'requests', 'servers'),
+            ((x.name, x.status, x.requests, [y.name for y in x.servers()])
+             for x in snapshot.backends()),
+            lambda x: "{},{},{},{}".format(x[0], x[1], x[2], ','.join(x[3])),
+            "# backend name, status, requests, servers", 'backends')
 
 
-def get_frontends(hap):
-    print("# frontend name, status, requests, process_nb")
-    for frontend in hap.frontends():
-        print("{},{},{},{}".format(frontend.name, frontend.status,
-                                   frontend.requests, frontend.process_nb))
+def frontends(snapshot):
+    return (('name', 'status', 'requests', 'process_nb'),
+            ((x.name, x.status, x.requests, x.process_nb)
+             for x in snapshot.frontends()),
+            "{},{},{},{}",
+            "# frontend name, status, requests, process_nb", 'frontends')
 
 
-def get_servers(hap):
-    print("# server name, status, requests, backend")
-    for server in hap.servers():
-        print("{},{},{},{}".format(server.name, server.status, server.requests,
-                                   server.backendname))
+def servers(snapshot):
+    return (('name', 'status', 'requests', 'backend'),
+            ((x.name, x.status, x.requests, x.backendname)
+             for x in snapshot.servers()),
+            "{},{},{},{}",
+            "# server name, status, requests, backend", 'servers')
 
 
-def dump(hap):
-    get_frontends(hap)
-    get_backends(hap)
-    get_servers(hap)
+def csv_sections(sections):
+    """Return columns and rows of sections as a single table
 
+    A CSV file has a single header, so rows of all sections have the columns
+    of all sections and a type column, frontend, backend or server, first.
+    Columns which a section doesn't have are empty.
+    """
+    columns = ['type']
+    for _columns, _, _, _, _ in sections:
+        columns.extend(x for x in _columns if x not in columns)
 
-def main():
-    arguments = docopt(__doc__)
-    args_passed = False
-    hap = haproxy_object(arguments)
+    def rows():
+        for _columns, _rows, _, _, section in sections:
+            for row in _rows:
+                values = dict(zip(_columns, row))
+                yield ((section[:-1],) +
+                       tuple(values.get(x) for x in columns[1:]))
+
+    return tuple(columns), rows()
 
-    if arguments['--frontends']:
-        args_passed = True
-        get_frontends(hap)
 
-    if arguments['--backends']:
-        args_passed = True
-        get_backends(hap)
+def dump(snapshot, writer, sections=(frontends, backends, servers)):
+    """Write sections of a snapshot, all of them by default"""
+    sections = [x(snapshot) for x in sections]
+    if writer.output == 'csv':
+        writer.rows(*csv_sections(sections))
+    else:
+        for section in sections:
+            writer.rows(*section)
+    writer.close()
 
-    if arguments['--servers']:
-        args_passed = True
-        get_servers(hap)
 
-    if not args_passed:
-        dump(hap)
+def main():
+    arguments = docopt(__doc__)
+    hap = haproxy_object(arguments)
+    # All sections are printed from the same statistics, which are retrieved
+    # with a single 'show stat' command per HAProxy process.
+    snapshot = Snapshot(hap)
+    sections = [y for x, y in (('--frontends', frontends),
+                               ('--backends', backends),
+                               ('--servers', servers)) if arguments[x]]
+    dump(snapshot, Writer(), sections or (frontends, backends, servers))
+
+    sys.stderr.write("# socket round trips: {}\n".format(snapshot.roundtrips))
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
     main()
@@ -0,0 +1,244 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Export metrics of HAProxy in the OpenMetrics text format
+
+Usage:
+    haproxytool export [-D DIR | -F SOCKET] [-l ADDR] [-t SECONDS]
+
+Arguments:
+    DIR      Directory path with socket files
+    SOCKET   Socket file
+    ADDR     Address to listen on as <host>:<port> or :<port> for all
+             addresses
+    SECONDS  Number of seconds, fractions are accepted
+
+Options:
+    -F SOCKET, --file SOCKET  socket file
+    -h, --help                show this screen
+    -l ADDR, --listen ADDR    serve metrics over HTTP on /metrics, metrics
+                              are printed once when it isn't given
+    -t SECONDS, --ttl SECONDS  time a scrape is served from the cache
+                              [default: 1]
+    -D DIR, --socket-dir=DIR  directory with HAProxy socket files
+                              [default: /var/lib/haproxy]
+
+"""
+import re
+import sys
+import time
+import threading
+from six.moves import BaseHTTPServer, socketserver
+from haproxyadmin import (HAPROXY_METRICS, FRONTEND_METRICS, BACKEND_METRICS,
+                          SERVER_METRICS)
+from haproxyadmin.exceptions import (CommandFailed, SocketApplicationError,
+                                     SocketConnectionError,
+                                     SocketPermissionError, SocketTimeout)
+from haproxyadmin.utils import converter, info2dict
+
+from .snapshot import Snapshot
+from .usage import docopt
+from .utils import haproxy_object
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+# Metrics which only go up, OpenMetrics requires a _total suffix for them
+COUNTERS = frozenset([
+    'CumConns', 'CumReq', 'CumSslConns', 'SslCacheLookups', 'SslCacheMisses',
+    'bin', 'bout', 'chkdown', 'chkfail', 'cli_abrt', 'comp_byp', 'comp_in',
+    'comp_out', 'comp_rsp', 'downtime', 'dreq', 'dresp', 'econ', 'ereq',
+    'eresp', 'hrsp_1xx', 'hrsp_2xx', 'hrsp_3xx', 'hrsp_4xx', 'hrsp_5xx',
+    'hrsp_other', 'lbtot', 'req_tot', 'srv_abrt', 'stot', 'wredis', 'wretr',
+])
+# Errors of a scrape which are reported to the scraper
+SCRAPE_ERRORS = (CommandFailed, SocketApplicationError, SocketConnectionError,
+                 SocketPermissionError, SocketTimeout, ValueError)
+INVALID_CHARS = re.compile(r'[^a-zA-Z0-9_]')
+
+
+def metric_name(kind, metric):
+    """Return the name of a metric family, such as haproxy_server_bin"""
+    return "haproxy_{}_{}".format(kind,
+                                  INVALID_CHARS.sub('_', metric).lower())
+
+
+def escape(value):
+    """Escape a label value"""
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def family(kind, metric, samples):
+    """Return the lines of a metric family
+
+    :param samples: list of 2-item tuple, labels as a string and value,
+      samples without a numeric value are skipped and a family without
+      samples has no lines
+    """
+    name = metric_name(kind, metric)
+    suffix = '_total' if metric in COUNTERS else ''
+    lines = ["{}{}{{{}}} {}".format(name, suffix, labels, value)
+             for labels, value in samples
+             if isinstance(value, (int, float)) and not isinstance(value, bool)]
+    if not lines:
+        return lines
+
+    return ["# TYPE {} {}".format(
+        name, 'counter' if metric in COUNTERS else 'gauge')] + lines
+
+
+def proxy_samples(objects, metric, labels):
+    """Yield labels and value of a metric for frontends, backends or servers
+
+    Values are aggregated across processes the same way '-m' does.
+    """
+    for obj in objects:
+        try:
+            yield labels(obj), obj.metric(metric)
+        except (KeyError, ValueError):
+            # The field isn't reported by this version of HAProxy
+            continue
+
+
+def exposition(hap):
+    """Return metrics of all HAProxy processes in the OpenMetrics format
+
+    'show info' and 'show stat' are sent in a single line per process.
+    """
+    info, stats = hap.commands([('show info', None), ('show stat', None)],
+                               full_output=True, pipeline=True)
+    snapshot = Snapshot(hap, stats)
+    lines = []
+    processes = [(process_nb, info2dict(output))
+                 for process_nb, output in info]
+    for metric in HAPROXY_METRICS:
+        lines.extend(family('process', metric, [
+            ('process="{}"'.format(process_nb), converter(values.get(metric)))
+            for process_nb, values in processes]))
+    for metric in FRONTEND_METRICS:
+        lines.extend(family('frontend', metric, proxy_samples(
+            snapshot.frontends(), metric,
+            lambda x: 'proxy="{}"'.format(escape(x.name)))))
+    for metric in BACKEND_METRICS:
+        lines.extend(family('backend', metric, proxy_samples(
+            snapshot.backends(), metric,
+            lambda x: 'proxy="{}"'.format(escape(x.name)))))
+    servers = snapshot.servers()
+    for metric in SERVER_METRICS:
+        lines.extend(family('server', metric, proxy_samples(
+            servers, metric,
+            lambda x: 'proxy="{}",server="{}"'.format(escape(x.backendname),
+                                                      escape(x.name)))))
+    lines.append('# EOF')
+
+    return '\n'.join(lines) + '\n'
+
+
+class Scraper(object):
+    """Serve scrapes from a cache which expires after ttl seconds
+
+    Scrapes which arrive while HAProxy is read wait for that read and share
+    its result, so HAProxy is read at most once per ttl seconds no matter how
+    many scrapers there are.
+
+    Argument:
+        hap (object): A runtime.HAProxy object
+        ttl (float): Seconds a result is served from the cache
+    """
+    def __init__(self, hap, ttl):
+        self.hap = hap
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._time = None
+        self._result = None
+
+    def scrape(self):
+        """Return a 2-item tuple, metrics and ``None`` or ``None`` and the
+        error of the scrape"""
+        with self._lock:
+            if self._time is None or time.time() - self._time >= self.ttl:
+                try:
+                    self._result = (exposition(self.hap), None)
+                except SCRAPE_ERRORS as error:
+                    self._result = (None, "{}".format(error))
+                self._time = time.time()
+
+            return self._result
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serve the metrics of the Scraper of the server on /metrics"""
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path.split('?')[0] != '/metrics':
+            self.reply(404, 'text/plain', "not found, use /metrics\n")
+            return
+        body, error = self.server.scraper.scrape()
+        if error is not None:
+            self.reply(503, 'text/plain', "scrape failed: {}\n".format(error))
+        else:
+            self.reply(200, CONTENT_TYPE, body)
+
+    def reply(self, status, content_type, body):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        # Scrapes are too frequent to be logged
+        pass
+
+
+class Server(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def listen_address(address):
+    """Return (host, port) of an address given as <host>:<port>
+
+    :raise: ValueError when the port isn't a number
+    """
+    host, _, port = address.rpartition(':')
+    try:
+        return host, int(port)
+    except ValueError:
+        raise ValueError("invalid address {}, expected <host>:<port> or "
+                         ":<port>".format(address))
+
+
+def main():
+    arguments = docopt(__doc__)
+    try:
+        ttl = float(arguments['--ttl'])
+        if ttl < 0:
+            raise ValueError
+    except ValueError:
+        sys.exit("--ttl expects a number of seconds, got {}"
+                 .format(arguments['--ttl']))
+    hap = haproxy_object(arguments)
+    scraper = Scraper(hap, ttl)
+    if arguments['--listen'] is None:
+        body, error = scraper.scrape()
+        if error is not None:
+            sys.exit(error)
+        sys.stdout.write(body)
+        return
+
+    try:
+        server = Server(listen_address(arguments['--listen']), Handler)
+    except (ValueError, OSError, IOError) as error:
+        sys.exit(error)
+    server.scraper = scraper
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        hap.close()
+
+# This is the standard boilerplate that calls the main() function.
+if __name__ == '__main__':
+    main()
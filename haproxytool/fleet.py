@@ -0,0 +1,262 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Run a command against many HAProxy instances at once
+
+Targets are read from a file with a target per line, an optional name
+followed by a stats socket, a directory with stats sockets or
+ipv4@<host>:<port> for a stats socket which listens on TCP. Empty lines and
+comments are skipped::
+
+    # name    socket
+    edge01    ipv4@10.1.0.1:9999
+    edge02    ipv4@10.1.0.2:9999
+    /run/haproxy
+
+The command runs in a haproxytool process per target, a bounded number of
+them at once, so a target which fails or hangs doesn't affect the others.
+A target which doesn't finish within --target-timeout seconds is stopped and
+reported as failed.
+Every line of output is prefixed with the name of the target, except the
+output of --output csv, json and ndjson, where every row has a host field
+with the name of the target instead, so the output can still be parsed.
+"""
+import io
+import os
+import sys
+import csv
+import json
+import threading
+import subprocess
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+# Options of haproxytool which aren't passed to the process of a target
+FLEET_OPTIONS = ('--targets', '--workers', '--target-timeout')
+# Options of a command which select the HAProxy processes
+SOCKET_OPTIONS = ('-D', '-F', '--socket-dir', '--file')
+
+# Output of targets which finish at the same time must not interleave
+LOCK = threading.Lock()
+
+
+def read_targets(path):
+    """Return a list of (name, socket) for all targets in a file"""
+    targets = []
+    with open(path) as file_handle:
+        for number, line in enumerate(file_handle, 1):
+            parts = line.split()
+            if not parts or parts[0].startswith('#'):
+                continue
+            if len(parts) > 2:
+                raise ValueError("line {}: expected an optional name and a "
+                                 "socket, got {}".format(number, line.strip()))
+            targets.append((parts[0], parts[-1]))
+
+    return targets
+
+
+def global_argv(argv, args):
+    """Return the options given before the command, without the ones of fleet
+    mode
+
+    :param argv: arguments of haproxytool, without the program name
+    :param args: arguments returned by docopt for argv
+    """
+    options = argv[:len(argv) - len(args['<args>']) - 1]
+    result = []
+    skip = False
+    for option in options:
+        if skip:
+            skip = False
+        elif option in FLEET_OPTIONS:
+            # The value is the next argument
+            skip = True
+        elif option.split('=')[0] not in FLEET_OPTIONS:
+            result.append(option)
+
+    return result
+
+
+def socket_args(socket_file):
+    """Return the options of a command which select a target"""
+    if os.path.isdir(socket_file):
+        return ['--socket-dir', socket_file]
+
+    return ['--file', socket_file]
+
+
+class Output(object):
+    """Write the output of targets in the format given with --output
+
+    Lines of table output and lines of other formats which aren't rows, such
+    as messages of commands which change objects, are prefixed with the name
+    of the target. csv output has a host column and a single header line,
+    ndjson objects have a host key and json rows of all targets are written
+    as a single document by close(), as a list or as an object with a list
+    per section for dump.
+
+    Argument:
+        output (str): One of output.FORMATS
+    """
+    def __init__(self, output):
+        self.output = output
+        self._header = None
+        self._rows = None
+        self._sections = OrderedDict()
+
+    def add(self, name, stdout):
+        """Write the standard output of a target, LOCK must be held"""
+        getattr(self, '_' + self.output)(name, stdout)
+        sys.stdout.flush()
+
+    def close(self):
+        if self._sections:
+            sys.stdout.write("{{\n{}\n}}\n".format(',\n'.join(
+                "{}: {}".format(json.dumps(x), rows(y))
+                for x, y in self._sections.items())))
+        elif self._rows is not None:
+            sys.stdout.write(rows(self._rows) + '\n')
+        sys.stdout.flush()
+
+    @staticmethod
+    def _table(name, stdout):
+        for line in stdout.splitlines():
+            sys.stdout.write("{}: {}\n".format(name, line))
+
+    def _csv(self, name, stdout):
+        lines = list(csv.reader(io.StringIO(stdout)))
+        if not lines:
+            return
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        if self._header is None:
+            self._header = lines[0]
+            writer.writerow(['host'] + lines[0])
+        writer.writerows([name] + x for x in lines[1:])
+
+    def _json(self, name, stdout):
+        try:
+            document = json.loads(stdout, object_pairs_hook=OrderedDict)
+        except ValueError:
+            document = None
+        if isinstance(document, list):
+            if self._rows is None:
+                self._rows = []
+            self._rows.extend(host(name, x) for x in document)
+        elif isinstance(document, dict):
+            for section, _rows in document.items():
+                self._sections.setdefault(section, []).extend(
+                    host(name, x) for x in _rows)
+        else:
+            self._table(name, stdout)
+
+    def _ndjson(self, name, stdout):
+        for line in stdout.splitlines():
+            try:
+                row = json.loads(line, object_pairs_hook=OrderedDict)
+            except ValueError:
+                row = None
+            if isinstance(row, dict):
+                sys.stdout.write(json.dumps(host(name, row)) + '\n')
+            else:
+                self._table(name, line)
+
+
+def host(name, row):
+    """Return a row of a target with the name of the target first"""
+    return OrderedDict([('host', name)] + list(row.items()))
+
+
+def rows(_rows):
+    """Return a list of rows as JSON with a row per line"""
+    if not _rows:
+        return '[]'
+
+    return "[\n{}\n]".format(',\n'.join(json.dumps(x) for x in _rows))
+
+
+def run_target(target, options, command, output, timeout):
+    """Run haproxytool for a target and print its output once it finishes
+
+    :param options: options of haproxytool given before the command
+    :param command: the command and its arguments
+    :param output: an Output object
+    :param timeout: seconds to wait for the command, it is killed after them
+    :return: ``None`` if the command was successful otherwise the error
+    :rtype: ``str``
+    """
+    name, socket_file = target
+    argv = ([sys.executable, '-m', 'haproxytool.cli'] + options +
+            command[:1] + socket_args(socket_file) + command[1:])
+    timed_out = False
+    try:
+        # Commands can't ask for confirmation, standard input is closed
+        with open(os.devnull) as devnull:
+            proc = subprocess.Popen(argv, stdin=devnull,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            try:
+                stdout, stderr = proc.communicate(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                # Output written before it was killed is still printed
+                proc.kill()
+                stdout, stderr = proc.communicate()
+                timed_out = True
+    except OSError as error:
+        return "{}".format(error)
+
+    with LOCK:
+        output.add(name, stdout.decode())
+        for line in stderr.decode().splitlines():
+            sys.stderr.write("{}: {}\n".format(name, line))
+        sys.stderr.flush()
+    if timed_out:
+        return "timed out after {} seconds".format(timeout)
+    if proc.returncode != 0:
+        return "exit status {}".format(proc.returncode)
+
+    return None
+
+
+def main(args, argv):
+    """Run the command of args against all targets
+
+    :param args: arguments returned by docopt for argv
+    :param argv: arguments of haproxytool, without the program name
+    """
+    if args['--profile'] is not None:
+        sys.exit("--profile can't be used with --targets")
+    for word in args['<args>']:
+        if word.split('=')[0] in SOCKET_OPTIONS or word[:2] in ('-D', '-F'):
+            sys.exit("{} can't be used with --targets".format(word))
+    try:
+        timeout = float(args['--target-timeout'])
+        if timeout <= 0:
+            raise ValueError
+    except ValueError:
+        sys.exit("--target-timeout expects a positive number, got {}"
+                 .format(args['--target-timeout']))
+    try:
+        targets = read_targets(args['--targets'])
+    except (IOError, OSError, ValueError) as error:
+        sys.exit(error)
+    if not targets:
+        sys.exit("no targets found in {}".format(args['--targets']))
+
+    options = global_argv(argv, args)
+    command = [args['<command>']] + args['<args>']
+    output = Output(args['--output'])
+    pool = ThreadPool(min(args['--workers'], len(targets)))
+    errors = pool.map(lambda x: run_target(x, options, command, output,
+                                           timeout),
+                      targets, chunksize=1)
+    pool.close()
+    output.close()
+    failed = 0
+    for (name, _), error in zip(targets, errors):
+        if error is not None:
+            failed += 1
+            sys.stderr.write("{}: FAILED: {}\n".format(name, error))
+
+    if failed:
+        sys.exit("{} of {} targets failed".format(failed, len(targets)))
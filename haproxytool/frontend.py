@@ -5,11 +5,16 @@
 
 Usage:
     haproxytool frontend [-D DIR -F SOCKET] (-c | -r | -s | -o | -e | -p | -i)
+                         [--where=EXPR] [NAME...]
+    haproxytool frontend [-D DIR -F SOCKET] -w OPTION VALUE [--where=EXPR]
+                         [NAME...]
+    haproxytool frontend [-D DIR -F SOCKET] [-f ] (-d | -t) [--where=EXPR]
                          [NAME...]
-    haproxytool frontend [-D DIR -F SOCKET] -w OPTION VALUE [NAME...]
-    haproxytool frontend [-D DIR -F SOCKET] [-f ] (-d | -t) [NAME...]
     haproxytool frontend [-D DIR -F SOCKET] (-l | -M)
-    haproxytool frontend [-D DIR -F SOCKET] -m METRIC [NAME...]
+    haproxytool frontend [-D DIR -F SOCKET] -m METRIC [--where=EXPR]
+                         [NAME...]
+    haproxytool frontend [-D DIR -F SOCKET] (--top | --bottom) METRIC [N]
+                         [--where=EXPR]
 
 Arguments:
     DIR     Directory path with socket files
@@ -17,6 +22,10 @@ Arguments:
     VALUE   Value to set
     OPTION  Setting name
     METRIC  Name of a metric, use '-M' to get metric names
+    N       Number of frontends to show, 10 by default
+    EXPR    Comparisons of fields of statistics with values, combined with
+            and, or, not and parentheses, such as 'status==DOWN and
+            scur>100', see 'haproxytool.where' for the syntax
 
 Options:
     -c, --showmaxconn         show max sessions
@@ -36,130 +45,199 @@ Options:
     -s, --status              show status
     -t, --shutdown            shutdown frontend
     -w, --write               change a frontend option
+    --top                     show frontends with the largest value of a
+                              metric
+    --bottom                  show frontends with the smallest value of a
+                              metric
+    --where=EXPR              select only frontends whose statistics match
+                              EXPR
     -D DIR, --socket-dir=DIR  directory with HAProxy socket files
                               [default: /var/lib/haproxy]
 
 """
 import sys
-from operator import methodcaller
-from docopt import docopt
 from haproxyadmin import FRONTEND_METRICS
-from haproxyadmin.exceptions import CommandFailed
+from haproxyadmin.exceptions import CommandFailed, HAProxyBaseError
+from haproxyadmin.utils import check_command
 
-from .utils import get_arg_option, abort_command, haproxy_object
+from .output import note, write
+from .usage import docopt
+from .utils import (GLOBAL_OPTIONS, get_arg_option, abort_command,
+                    haproxy_object, positive_number)
 
 
 class FrontendCommand():
+    # Methods which need only names, IDs and process numbers of frontends,
+    # which are read from the topology cache when it is enabled
+    TOPOLOGY_METHODS = [
+        'show',
+        'iid',
+        'process',
+        'enable',
+        'disable',
+        'shutdown',
+        'write',
+    ]
+    # Methods which read metrics of all frontends from a single snapshot
+    SNAPSHOT_METHODS = [
+        'top',
+        'bottom',
+    ]
+
     def __init__(self, hap, args):
+        # Imported only here, usage and help of the command don't need it
+        from .snapshot import Snapshot
         self.hap = hap
         self.args = args
+        self.stats = hap
+        method = get_arg_option(args)
+        if (GLOBAL_OPTIONS['--cache'] and method in self.TOPOLOGY_METHODS
+                and args['--where'] is None):
+            from .cache import topology
+            self.stats = topology(hap)
+        elif method in self.SNAPSHOT_METHODS:
+            self.stats = Snapshot(hap)
         self.frontends = self.build_frontend_list(args['NAME'])
+        if args['--where'] is not None:
+            stats = self.stats
+            if not isinstance(stats, Snapshot):
+                stats = Snapshot(hap)
+            from .where import where
+            try:
+                self.frontends = where(args['--where'], self.frontends,
+                                       stats.frontends(), lambda x: x.name)
+            except ValueError as error:
+                sys.exit(error)
 
     def build_frontend_list(self, names=None):
         frontends = []
         if not names:
-            for frontend in self.hap.frontends():
+            for frontend in self.stats.frontends():
                 frontends.append(frontend)
         else:
             for name in names:
                 try:
-                    frontends.append(self.hap.frontend(name))
+                    frontends.append(self.stats.frontend(name))
                 except ValueError:
-                    print("{} was not found".format(name))
+                    note("{} was not found".format(name))
 
         return frontends
 
+    def write_frontends(self, column, value, line=None):
+        """Write name and a value of every frontend"""
+        write(('frontendname', column),
+              ((x.name, value(x)) for x in self.frontends), line)
+
     def show(self):
-        for frontend in self.frontends:
-            print("{}".format(frontend.name))
+        write(('frontendname',), ((x.name,) for x in self.frontends))
 
     def status(self):
-        for frontend in self.frontends:
-            print("{} {}".format(frontend.name, frontend.status))
+        self.write_frontends('status', lambda x: x.status)
 
     def requests(self):
-        for frontend in self.frontends:
-            print("{} {}".format(frontend.name, frontend.requests))
+        self.write_frontends('requests', lambda x: x.requests)
 
     def iid(self):
-        for frontend in self.frontends:
-            print("{} {}".format(frontend.name, frontend.iid))
+        self.write_frontends('iid', lambda x: x.iid)
 
     def process(self):
-        for frontend in self.frontends:
-            print("{} {}".format(frontend.name, frontend.process_nb))
+        self.write_frontends('process_nb', lambda x: x.process_nb)
 
     def options(self):
-        for frontend in self.frontends:
-            print("{} maxconn={}".format(frontend.name, frontend.maxconn))
-
-    def enable(self):
-        for frontend in self.frontends:
+        self.write_frontends('maxconn', lambda x: x.maxconn, "{} maxconn={}")
+
+    def report(self, cmds, done_msg, failed_msg):
+        """Send a command per frontend and report the result
+
+        Commands are sent to every process over a single connection, joined
+        with a semicolon. It exits with status 1 if the command failed for any
+        frontend.
+        """
+        failed = False
+        outputs = self.hap.commands(cmds, pipeline=True)
+        for frontend, results in zip(self.frontends, outputs):
             try:
-                frontend.enable()
-                print("{} enabled".format(frontend.name))
+                check_command(results)
+                print(done_msg.format(frontend.name))
             except CommandFailed as error:
-                print("{} failed to be enabled:{}".format(frontend.name,
-                                                          error))
+                failed = True
+                print(failed_msg.format(frontend.name, error))
+        if failed:
+            sys.exit(1)
+
+    def enable(self):
+        cmds = [("enable frontend {}".format(frontend.name),
+                 frontend.process_nb) for frontend in self.frontends]
+        self.report(cmds, "{} enabled", "{} failed to be enabled:{}")
 
     def disable(self):
         if abort_command('disable', 'frontends', self.frontends,
                          self.args['--force']):
             sys.exit('Aborted by user')
 
-        for frontend in self.frontends:
-            try:
-                frontend.disable()
-                print("{} disabled".format(frontend.name))
-            except CommandFailed as error:
-                print("{} failed to be disabled:{}".format(frontend.name,
-                                                           error))
+        cmds = [("disable frontend {}".format(frontend.name),
+                 frontend.process_nb) for frontend in self.frontends]
+        self.report(cmds, "{} disabled", "{} failed to be disabled:{}")
 
     def shutdown(self):
         if abort_command('shutdown', 'frontends', self.frontends,
                          self.args['--force']):
             sys.exit('Aborted by user')
 
-        for frontend in self.frontends:
-            try:
-                frontend.shutdown()
-                print("{} shutdown".format(frontend.name))
-            except CommandFailed as error:
-                print("{} failed to be shutdown:{}".format(frontend.name,
-                                                           error))
+        cmds = [("shutdown frontend {}".format(frontend.name),
+                 frontend.process_nb) for frontend in self.frontends]
+        self.report(cmds, "{} shutdown", "{} failed to be shutdown:{}")
 
     def write(self):
         setting = self.args['OPTION']
         value = self.args['VALUE']
         try:
             value = int(value)
-            call_method = methodcaller('setmaxconn', value, die=False)
-            for frontend in self.frontends:
-                if call_method(frontend):
-                    print("{} set {} to {}".format(frontend.name,
-                                                   setting,
-                                                   value))
-                else:
-                    print("{} failed to set maxconn on {}".format(frontend.name,
-                                                                  value))
         except ValueError:
             sys.exit("You need to pass a number, got {}".format(value))
 
+        cmds = [("set maxconn frontend {} {}".format(frontend.name, value),
+                 frontend.process_nb) for frontend in self.frontends]
+        outputs = self.hap.commands(cmds, pipeline=True)
+        for frontend, results in zip(self.frontends, outputs):
+            try:
+                check_command(results)
+            except HAProxyBaseError:
+                print("{} failed to set maxconn on {}".format(frontend.name,
+                                                              value))
+            else:
+                print("{} set {} to {}".format(frontend.name, setting, value))
+
     def metric(self):
         metric = self.args['METRIC']
         if metric not in FRONTEND_METRICS:
             sys.exit("{} no valid metric".format(metric))
 
-        for frontend in self.frontends:
-            print("{} {}".format(frontend.name, frontend.metric(metric)))
+        self.write_frontends(metric, lambda x: x.metric(metric))
+
+    def top(self):
+        self.ranking(largest=True)
+
+    def bottom(self):
+        self.ranking(largest=False)
+
+    def ranking(self, largest):
+        """Show the frontends with the largest or smallest value of a metric"""
+        metric = self.args['METRIC']
+        if metric not in FRONTEND_METRICS:
+            sys.exit("{} no valid metric".format(metric))
+
+        from .snapshot import rank
+        ranked = rank(self.frontends, metric,
+                      positive_number(self.args, 'N', 10), largest)
+        write(('frontendname', metric),
+              ((x.name, value) for value, x in ranked))
 
     def showmetrics(self):
-        for metric in FRONTEND_METRICS:
-            print(metric)
+        write(('metric',), ((x,) for x in FRONTEND_METRICS))
 
     def showmaxconn(self):
-        for frontend in self.frontends:
-            print("{n} {s}".format(n=frontend.name, s=frontend.maxconn))
+        self.write_frontends('maxconn', lambda x: x.maxconn)
 
 
 def main():
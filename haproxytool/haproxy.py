@@ -42,10 +42,10 @@ Options:
 """
 import sys
 from operator import methodcaller
-from docopt import docopt
 from haproxyadmin import haproxy, HAPROXY_METRICS
 from haproxyadmin.exceptions import CommandFailed
 
+from .usage import docopt
 from .utils import get_arg_option, print_cmd_output, haproxy_object
 
 OPTIONS = {
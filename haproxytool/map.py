@@ -10,12 +10,16 @@ Usage:
     haproxytool map [-D DIR | -F SOCKET] -g MAPID KEY
     haproxytool map [-D DIR | -F SOCKET] (-S | -A) MAPID KEY VALUE
     haproxytool map [-D DIR | -F SOCKET] -d MAPID KEY
+    haproxytool map [-D DIR | -F SOCKET] (-i | -r) MAPID FILE
+    haproxytool map [-D DIR | -F SOCKET] [-n] -y MAPID FILE
 
 
 Arguments:
     DIR     Directory path with socket files
+    FILE    File with an entry per line, key and value separated by spaces,
+            use '-' for standard input
     MAPID   ID of the map or file returned by show map
-    KEY     ID of key
+    KEY     ID of key, use '-' with '-g' to read many keys from standard input
     SOCKET  Socket file
     VALUE   Value to set
 
@@ -23,23 +27,39 @@ Options:
     -A, --add                 add a <KEY> entry into the map <MAPID>
     -F SOCKET, --file SOCKET  socket file
     -h, --help                show this screen
+    -i, --import              add all entries of <FILE> into the map <MAPID>
     -s, --show                show map
     -g, --get                 lookup the value of a key in the map
     -c, --clear               clear all entries for a map
     -l, --list                list all map ids
+    -r, --replace             replace all entries of the map <MAPID> with the
+                              entries of <FILE> in one step
+    -n, --dry-run             show how many entries would change without
+                              changing the map
     -S, --set                 set a new value for a key in a map
+    -y, --sync                change the map <MAPID> to have the same entries
+                              as <FILE>
     -d, --delete              delete all the map entries from the map <MAPID>
                               corresponding to the key <KEY>
     -D DIR, --socket-dir=DIR  directory with HAProxy socket files
                               [default: /var/lib/haproxy]
 
 """
+import re
 import sys
-from docopt import docopt
-from haproxyadmin.exceptions import CommandFailed
+from itertools import chain
+from haproxyadmin.exceptions import CommandFailed, HAProxyBaseError
 
+from .bulk import (VERSION, Progress, check_target, chunks, escape,
+                   open_file, parse_entry, read_map, replace, send, target)
+from .usage import docopt
 from .utils import get_arg_option, haproxy_object
 
+# Output of get map command
+# type=str, case=sensitive, found=yes, idx=tree, key="foo", value="bar", ...
+MATCH_TYPE = re.compile(r'type=(\w+), case=(\w+)')
+FOUND_VALUE = re.compile(r'found=yes, .*value="(.*)", type="[^"]*"$')
+
 
 class MapCommand():
     def __init__(self, hap, args):
@@ -72,11 +92,66 @@ class MapCommand():
             sys.exit(error)
 
     def get(self):
+        if self.args['KEY'] == '-':
+            self.get_many()
+            return
         try:
             print(self.hap.get_map(self.args['MAPID'], self.args['KEY']))
         except (CommandFailed, ValueError) as error:
             sys.exit(error)
 
+    def get_many(self):
+        """Lookup keys read from standard input
+
+        Maps which match keys exactly are retrieved once and keys are looked
+        up locally, other maps need HAProxy to do the matching and get map
+        commands are sent in chunks.
+        """
+        mapid = target(self.args['MAPID'])
+        keys = (line.strip() for line in sys.stdin if line.strip())
+        first = next(keys, None)
+        if first is None:
+            return
+        keys = chain([first], keys)
+        # Only the 1st process as the content of a map is the same
+        process_nbs = self.hap.process_nbs[:1]
+        try:
+            check_target(self.hap.show_map(), mapid)
+            output = self.hap.commands(
+                [("get map {} {}".format(mapid, escape(first)), process_nbs)],
+                pipeline=True)[0][0][1]
+            match_type = MATCH_TYPE.match(output)
+            if match_type is None:
+                raise CommandFailed(output)
+            if match_type.group(1) == 'str':
+                insensitive = match_type.group(2) == 'insensitive'
+                index = {}
+                for line in self.hap.show_map(mapid=self.args['MAPID']):
+                    _, key, value = parse_entry(line)
+                    index.setdefault(key.lower() if insensitive else key,
+                                     value)
+                for key in keys:
+                    self.found(key, index.get(key.lower() if insensitive
+                                              else key))
+                return
+
+            for chunk in chunks(keys):
+                results = self.hap.commands(
+                    [("get map {} {}".format(mapid, escape(key)), process_nbs)
+                     for key in chunk], pipeline=True)
+                for key, result in zip(chunk, results):
+                    value = FOUND_VALUE.search(result[0][1])
+                    self.found(key, value.group(1) if value else None)
+        except (HAProxyBaseError, ValueError) as error:
+            sys.exit(error)
+
+    @staticmethod
+    def found(key, value):
+        if value is None:
+            sys.stderr.write("{} was not found\n".format(key))
+        else:
+            print("{} {}".format(key, value))
+
     def delete(self):
         try:
             if self.hap.del_map(self.args['MAPID'], self.args['KEY']):
@@ -108,6 +183,105 @@ class MapCommand():
         except (CommandFailed, ValueError) as error:
             sys.exit(error)
 
+    def entries(self, file_handle, progress, cmd):
+        """Yield an 'add map' command for every entry of a file"""
+        for number, key, value in read_map(file_handle):
+            if value is None:
+                progress.error("line {}: {} has no value".format(number, key))
+                continue
+            yield ("line {}".format(number),
+                   "{} {} {}".format(cmd, escape(key), escape(value)))
+
+    def import_(self):
+        mapid = target(self.args['MAPID'])
+        progress = Progress('added')
+        try:
+            check_target(self.hap.show_map(), mapid)
+            with open_file(self.args['FILE']) as file_handle:
+                send(self.hap,
+                     self.entries(file_handle, progress,
+                                  "add map {}".format(mapid)),
+                     progress)
+        except (CommandFailed, IOError, OSError, ValueError) as error:
+            sys.exit(error)
+        print(progress.summary())
+        if progress.failed:
+            sys.exit(1)
+
+    def replace(self):
+        mapid = target(self.args['MAPID'])
+        progress = Progress('loaded')
+        try:
+            check_target(self.hap.show_map(), mapid)
+            with open_file(self.args['FILE']) as file_handle:
+                replace(self.hap, 'map', mapid,
+                        self.entries(file_handle, progress,
+                                     "add map {} {}".format(VERSION, mapid)),
+                        progress)
+        except (HAProxyBaseError, IOError, OSError, ValueError) as error:
+            print(progress.summary())
+            sys.exit(error)
+        print(progress.summary())
+        print("map was replaced successfully")
+
+    def sync(self):
+        mapid = target(self.args['MAPID'])
+        progress = Progress('changed')
+        entries = {}
+        try:
+            with open_file(self.args['FILE']) as file_handle:
+                for number, key, value in read_map(file_handle):
+                    if value is None:
+                        progress.error("line {}: {} has no value"
+                                       .format(number, key))
+                    elif key not in entries:
+                        # HAProxy uses the 1st entry of a key in a map file
+                        entries[key] = value
+            live_entries = {}
+            duplicates = set()
+            for line in self.hap.show_map(mapid=self.args['MAPID']):
+                _, key, value = parse_entry(line)
+                if key in live_entries:
+                    duplicates.add(key)
+                else:
+                    live_entries[key] = value
+        except (CommandFailed, IOError, OSError, ValueError) as error:
+            sys.exit(error)
+
+        adds = [x for x in entries if x not in live_entries]
+        updates = [x for x in entries if x in live_entries and
+                   (x in duplicates or entries[x] != live_entries[x])]
+        deletes = [x for x in live_entries if x not in entries]
+        print("{} to add, {} to update, {} to delete, {} unchanged"
+              .format(len(adds), len(updates), len(deletes),
+                      len(entries) - len(adds) - len(updates)))
+        if self.args['--dry-run']:
+            if progress.failed:
+                sys.exit(1)
+            return
+
+        def build():
+            for key in adds:
+                yield ('add', "add map {} {} {}".format(
+                    mapid, escape(key), escape(entries[key])))
+            for key in updates:
+                if key in duplicates:
+                    # set map changes all entries of a key, we want one
+                    yield ('update', "del map {} {}".format(mapid,
+                                                           escape(key)))
+                    yield ('update', "add map {} {} {}".format(
+                        mapid, escape(key), escape(entries[key])))
+                else:
+                    yield ('update', "set map {} {} {}".format(
+                        mapid, escape(key), escape(entries[key])))
+            for key in deletes:
+                yield ('delete', "del map {} {}".format(mapid, escape(key)))
+
+        send(self.hap, build(), progress)
+        print(progress.summary())
+        if progress.failed:
+            sys.exit(1)
+
 
 def main():
     arguments = docopt(__doc__)
@@ -115,7 +289,8 @@ def main():
 
     cmd = MapCommand(hap, arguments)
     method = get_arg_option(arguments)
-    getattr(cmd, method)()
+    # Methods named after a keyword of Python have a trailing underscore
+    (getattr(cmd, method + '_', None) or getattr(cmd, method))()
 
 # This is the standard boilerplate that calls the main() function.
 if __name__ == '__main__':
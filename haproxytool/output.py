@@ -0,0 +1,159 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Write the rows of read commands in the format given with --output
+
+table is the format haproxytool always had, csv has a header line with the
+names of the columns, json is a list of objects and ndjson is an object per
+line. Rows are written as they are generated, in batches of BATCH_SIZE lines,
+so the output of many objects isn't kept in memory and it costs a write per
+batch rather than a print per row.
+
+csv and json are imported by the formats which use them, most commands write
+tables.
+"""
+import sys
+from collections import OrderedDict
+
+from .utils import GLOBAL_OPTIONS
+
+FORMATS = ('table', 'csv', 'json', 'ndjson')
+# Number of lines which are written at once
+BATCH_SIZE = 1024
+
+
+class Writer(object):
+    """Write rows in one of FORMATS
+
+    A command which writes several groups of rows names every group with
+    section and calls close() at the end, json output is then an object with
+    a list of rows per section and ndjson objects have a section key.
+
+    Argument:
+        output (str): One of FORMATS, the one given with --output by default
+        stream (file): Where to write, standard output by default
+    """
+    def __init__(self, output=None, stream=None):
+        self.output = output or GLOBAL_OPTIONS['--output']
+        self.stream = stream or sys.stdout
+        self._buffer = []
+        self._sections = 0
+        self._csv_writer = None
+
+    def write(self, line):
+        """Add a line to the buffer, which is written once it is full"""
+        self._buffer.append(line)
+        if len(self._buffer) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.stream.write(''.join(self._buffer))
+            del self._buffer[:]
+        self.stream.flush()
+
+    def rows(self, columns, rows, line=None, header=None, section=None):
+        """Write rows
+
+        Rows which were generated are written even when generating the rest
+        fails.
+
+        :param columns: names of the values of a row
+        :type columns: ``tuple``
+        :param rows: an iterable of tuples with a value per column
+        :param line: format string or function which returns a row in table
+          format, values are separated by a space by default
+        :param header: line before the rows in table format
+        :param section: name of the rows
+        """
+        try:
+            getattr(self, '_' + self.output)(columns, rows, line, header,
+                                             section)
+        finally:
+            self.flush()
+
+    def close(self):
+        """Finish the output of a command which wrote sections"""
+        if self.output == 'json' and self._sections:
+            self.write("\n}\n")
+        self.flush()
+
+    def _table(self, columns, rows, line, header, section):
+        # pylint: disable=unused-argument
+        if header is not None:
+            self.write(header + '\n')
+        if line is None:
+            line = ' '.join(['{}'] * len(columns))
+        if callable(line):
+            for row in rows:
+                self.write(line(row) + '\n')
+        else:
+            for row in rows:
+                self.write(line.format(*row) + '\n')
+
+    def _csv(self, columns, rows, line, header, section):
+        # pylint: disable=unused-argument
+        if self._csv_writer is None:
+            import csv
+            self._csv_writer = csv.writer(self, lineterminator='\n')
+        self._csv_writer.writerow(columns)
+        self._csv_writer.writerows([cell(x) for x in row] for row in rows)
+
+    def _json(self, columns, rows, line, header, section):
+        # pylint: disable=unused-argument
+        import json
+        if section is None:
+            self.write('[')
+        else:
+            self.write('{\n' if not self._sections else ',\n')
+            self.write("{}: [".format(json.dumps(section)))
+            self._sections += 1
+        separator = '\n'
+        for row in objects(columns, rows):
+            self.write(separator + row)
+            separator = ',\n'
+        self.write('\n]' if separator != '\n' else ']')
+        if section is None:
+            self.write('\n')
+
+    def _ndjson(self, columns, rows, line, header, section):
+        # pylint: disable=unused-argument
+        if section is not None:
+            columns = ('section',) + tuple(columns)
+            rows = ((section,) + tuple(x) for x in rows)
+        for row in objects(columns, rows):
+            self.write(row + '\n')
+
+
+def objects(columns, rows):
+    """Yield every row as a JSON object with a key per column"""
+    import json
+    encode = json.JSONEncoder().encode
+    for row in rows:
+        yield encode(OrderedDict(zip(columns, row)))
+
+
+def cell(value):
+    """Return the value of a CSV cell, a list is a space separated string"""
+    if isinstance(value, list):
+        return ' '.join("{}".format(x) for x in value)
+
+    return value
+
+
+def write(columns, rows, line=None, header=None):
+    """Write rows of a command in the format given with --output, see
+    Writer.rows()"""
+    Writer().rows(columns, rows, line, header)
+
+
+def note(message):
+    """Print a message which isn't a row, such as a name which wasn't found
+
+    It goes to standard error for formats other than table, so the output
+    can be parsed.
+    """
+    if GLOBAL_OPTIONS['--output'] == 'table':
+        print(message)
+    else:
+        sys.stderr.write(message + '\n')
@@ -0,0 +1,563 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Send commands to HAProxy processes
+
+This module provides a HAProxy class which extends haproxy.HAProxy class of
+haproxyadmin. It can send commands to all HAProxy processes concurrently,
+either with a pool of threads or with asyncio, and always returns results
+ordered by the process number. Reads of haproxyadmin objects, such as the
+status of a backend, are sent to all processes by the same pool, see
+across_all_procs(). It can also keep a single connection open per
+HAProxy process for the whole run and send many commands in a single line,
+see Session class.
+"""
+import os
+import re
+import glob
+import time
+import socket
+import threading
+from collections import OrderedDict
+from haproxyadmin import HAPROXY_METRICS, backend, frontend, haproxy, server
+from haproxyadmin.backend import Backend
+from haproxyadmin.frontend import Frontend
+from haproxyadmin.exceptions import SocketConnectionError, SocketTimeout
+from haproxyadmin.internal.haproxy import _HAProxyProcess
+from haproxyadmin.utils import (calculate, connected_socket, converter,
+                                info2dict, is_unix_socket, should_die)
+
+# HAProxy prints it after the output of every command in prompt mode
+PROMPT = b'\n> '
+# Maximum length of a line with many commands, HAProxy needs to buffer the
+# whole line and the default size of its buffers is 16KB
+PIPELINE_SIZE = 8192
+# HAProxy runs the parts of a line separated by a semicolon as commands, a
+# semicolon which is escaped with a backslash is part of the command
+SEMICOLON = re.compile(r'(?<!\\);')
+# Prefix of a stats socket which listens on TCP, ipv4@<address>:<port>
+TCP_PREFIX = 'ipv4@'
+# Set in threads of a pool while they run a function of HAProxy.map()
+_WORKER = threading.local()
+
+
+class Session(object):
+    """A connection to a HAProxy stats socket in interactive mode
+
+    In non-interactive mode HAProxy closes the connection after a command is
+    processed. Once the 'prompt' command is sent, HAProxy keeps the
+    connection open and prints a prompt after the output of every command,
+    which is used to find where the output ends. The connection is opened
+    again when HAProxy closes it.
+
+    Argument:
+        socket_file (str): A HAProxy stats socket file
+        timeout (float): Timeout for the connection
+        tracer (object): A trace.Tracer which records every line sent
+    """
+    def __init__(self, socket_file, timeout=1, tracer=None):
+        self.socket_file = socket_file
+        self.timeout = timeout
+        self.tracer = tracer
+        self._socket = None
+        # Commands from different threads must not interleave
+        self._lock = threading.Lock()
+
+    def connect(self):
+        family, address = socket_address(self.socket_file)
+        try:
+            self._socket = socket.socket(family, socket.SOCK_STREAM)
+            self._socket.settimeout(self.timeout)
+            self._socket.connect(address)
+        except socket.timeout:
+            self.close()
+            raise SocketTimeout(socket_file=self.socket_file)
+        except socket.error:
+            self.close()
+            raise SocketConnectionError(self.socket_file)
+        self._send(['prompt'])
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _send(self, cmds):
+        """Send commands in one line and return the raw output of each one
+
+        Output of every command is followed by the prompt. A command which
+        has a semicolon is several commands for HAProxy, their output is
+        joined.
+        """
+        start = time.time()
+        line = (';'.join(cmds) + '\n').encode()
+        self._socket.sendall(line)
+        outputs = []
+        # Output is collected in a bytearray, which grows in place, and the
+        # prompt is searched only in data which wasn't searched yet, so a
+        # large output costs linear time.
+        data = bytearray()
+        start_index = 0
+        received = 0
+        for cmd in cmds:
+            output = bytearray()
+            for _ in SEMICOLON.split(cmd):
+                index = data.find(PROMPT, start_index)
+                while index == -1:
+                    # The prompt may be split across two chunks
+                    start_index = max(0, len(data) - len(PROMPT) + 1)
+                    chunk = self._socket.recv(65536)
+                    if not chunk:
+                        raise EOFError
+                    received += len(chunk)
+                    data += chunk
+                    index = data.find(PROMPT, start_index)
+                output += data[:index + 1]
+                del data[:index + len(PROMPT)]
+                start_index = 0
+            outputs.append(bytes(output))
+        if self.tracer is not None:
+            self.tracer.record(self.socket_file, cmds, len(line), received,
+                               start)
+
+        return outputs
+
+    def command(self, command, full_output=False):
+        """Send a command to HAProxy.
+
+        It returns the same output as _HAProxyProcess.command of
+        haproxyadmin, 1st line of the output or the whole output as a list.
+        """
+        return self.commands([command], full_output=full_output)[0]
+
+    def commands(self, commands, full_output=False):
+        """Send many commands to HAProxy separated by a semicolon
+
+        Commands are sent in lines of up to PIPELINE_SIZE bytes, so HAProxy
+        can buffer them.
+
+        :return: output of every command in the same order as commands
+        :rtype: ``list``
+        """
+        outputs = []
+        with self._lock:
+            for chunk in chunks(commands):
+                for attempt in (1, 2):
+                    try:
+                        if self._socket is None:
+                            self.connect()
+                        outputs.extend(self._send(chunk))
+                        break
+                    except socket.timeout:
+                        self.close()
+                        raise SocketTimeout(socket_file=self.socket_file)
+                    except (EOFError, socket.error):
+                        # HAProxy closed the connection, e.g. it was reloaded
+                        # or the idle timeout of the stats socket expired.
+                        self.close()
+                        if attempt == 2:
+                            raise SocketConnectionError(self.socket_file)
+
+        return [_output(x.decode().splitlines(), full_output, self.socket_file)
+                for x in outputs]
+
+
+class _Process(_HAProxyProcess):
+    """A _HAProxyProcess which can send commands over a Session
+
+    haproxyadmin talks only to UNIX sockets, a Session is always used for
+    sockets which listen on TCP.
+
+    Argument:
+        persistent (bool): Keep a connection open to the process
+        tracer (object): A trace.Tracer which records every command sent
+    """
+    def __init__(self, socket_file, persistent=False, tracer=None, **kwargs):
+        self.session = None
+        self.tracer = tracer
+        # HAProxy.map() of the HAProxy the process belongs to, objects of
+        # the process are read with it, see across_all_procs()
+        self.map = None
+        if persistent or socket_file.startswith(TCP_PREFIX):
+            self.session = Session(socket_file, kwargs.get('timeout', 1),
+                                   tracer)
+        _HAProxyProcess.__init__(self, socket_file, **kwargs)
+
+    def proc_info(self):
+        """Return information about the process and keep the last one
+
+        It is read when the object is created, see identity().
+        """
+        self.hap_info = _HAProxyProcess.proc_info(self)
+        self.info_time = time.time()
+
+        return self.hap_info
+
+    def identity(self):
+        """Return what identifies a running HAProxy process
+
+        A process which was restarted or reloaded has a different process ID
+        or start time. Start time is calculated from the uptime, which is in
+        seconds, so it is rounded.
+
+        :return: socket file, process number, process ID and start time
+        :rtype: ``list``
+        """
+        return [self.socket_file, int(self.hap_info['Process_num']),
+                int(self.hap_info['Pid']),
+                int(round(self.info_time -
+                          int(self.hap_info['Uptime_sec'])))]
+
+    def command(self, command, full_output=False):
+        if self.session is not None:
+            return self.session.command(command, full_output=full_output)
+        if self.tracer is None:
+            return _HAProxyProcess.command(self, command,
+                                           full_output=full_output)
+
+        start = time.time()
+        lines = _HAProxyProcess.command(self, command, full_output=True)
+        # haproxyadmin doesn't expose the raw output, count the lines
+        self.tracer.record(self.socket_file, [command], len(command) + 1,
+                           sum(len(x) + 1 for x in lines), start)
+
+        return lines if full_output else lines[0]
+
+    def commands(self, commands, full_output=False, pipeline=False):
+        """Send many commands, over a single line when a Session is used
+
+        A Session is opened only for these commands when pipeline is set.
+        """
+        if self.session is not None:
+            return self.session.commands(commands, full_output=full_output)
+        if not pipeline:
+            return [self.command(x, full_output=full_output) for x in commands]
+
+        session = Session(self.socket_file, self.timeout, self.tracer)
+        try:
+            return session.commands(commands, full_output=full_output)
+        finally:
+            session.close()
+
+
+class HAProxy(haproxy.HAProxy):
+    """Build a haproxy.HAProxy object which can run commands in parallel
+
+    Argument:
+        socket_dir (str): A directory with HAProxy stats socket files
+        socket_file (str): A HAProxy stats socket file or ipv4@<host>:<port>
+            for a stats socket which listens on TCP
+        parallel (int): Number of workers to use for sending a command to
+            all processes, None sends it to one process after the other.
+            When asyncio is used, it is the number of commands in flight
+            per process.
+        use_asyncio (bool): Send commands with asyncio
+        persistent (bool): Keep a connection open to every process, it isn't
+            used by asyncio
+        tracer (object): A trace.Tracer which records every command sent
+        retry (int): Number of times to retry after a connection failure
+        retry_interval (int): Sleep time between the retries
+        timeout (float): Timeout for the connection
+    """
+    def __init__(self, socket_dir=None, socket_file=None, parallel=None,
+                 use_asyncio=False, persistent=False, retry=2,
+                 retry_interval=2, timeout=1, tracer=None):
+        # pylint: disable=super-init-not-called
+        # We run the same discovery as haproxy.HAProxy but let the pool
+        # talk to all socket files at once.
+        self.parallel = parallel
+        self.use_asyncio = use_asyncio
+        self.timeout = timeout
+        self.persistent = persistent
+        self.tracer = tracer
+        self._pool = None
+        socket_files = []
+
+        if socket_dir:
+            if not os.path.exists(socket_dir):
+                raise ValueError("socket directory does not exist "
+                                 "{}".format(socket_dir))
+            socket_files = [x for x in glob.glob(os.path.join(socket_dir, '*'))
+                            if is_unix_socket(x)]
+            connected = self.map(self._connected_socket, socket_files)
+            socket_files = [x for x, y in zip(socket_files, connected) if y]
+        elif socket_file and socket_file.startswith(TCP_PREFIX):
+            # It is checked when the process number is read
+            socket_address(socket_file)
+            socket_files.append(socket_file)
+        elif (socket_file and is_unix_socket(socket_file) and
+              self._connected_socket(socket_file)):
+            socket_files.append(os.path.realpath(socket_file))
+        else:
+            raise ValueError("UNIX socket file was not set")
+
+        if not socket_files:
+            raise ValueError("No valid UNIX socket file was found, directory: "
+                             "{} file: {}".format(socket_dir, socket_file))
+
+        self._hap_processes = self.map(
+            lambda x: _Process(socket_file=x,
+                               persistent=persistent,
+                               tracer=tracer,
+                               retry=retry,
+                               retry_interval=retry_interval,
+                               timeout=timeout),
+            socket_files)
+        self._hap_processes.sort(key=lambda x: int(x.process_nb))
+        for hap_process in self._hap_processes:
+            hap_process.map = self.map
+
+    def _connected_socket(self, socket_file):
+        """Check if a socket file is a HAProxy stats socket"""
+        start = time.time()
+        connected = connected_socket(socket_file, self.timeout)
+        if self.tracer is not None:
+            # The output of 'show info' isn't returned by haproxyadmin
+            self.tracer.record(socket_file, ['show info'], 10, None, start)
+
+        return connected
+
+    def identity(self):
+        """Return the identity of every HAProxy process, see _Process"""
+        return [x.identity() for x in self._hap_processes]
+
+    @property
+    def process_nbs(self):
+        """Return the process numbers of all HAProxy processes"""
+        return [int(x.process_nb) for x in self._hap_processes]
+
+    def close(self):
+        """Close connections which are kept open to HAProxy processes"""
+        for hap_process in self._hap_processes:
+            if hap_process.session is not None:
+                hap_process.session.close()
+
+    def map(self, function, items):
+        """Call function for every item and return results in the same order
+
+        Items are processed by the pool of workers when parallel mode or
+        asyncio is enabled. A function which runs in a worker calls map()
+        again without the pool, as waiting for the pool from a worker can
+        take all workers.
+        """
+        items = list(items)
+        workers = self.parallel
+        if workers is None and self.use_asyncio:
+            # Calls to haproxyadmin block, give a worker to every item
+            workers = len(items)
+        if not workers or len(items) < 2 or getattr(_WORKER, 'busy', False):
+            return [function(x) for x in items]
+
+        if self._pool is None:
+            # Imported only here, as multiprocessing takes long to import
+            from multiprocessing.pool import ThreadPool
+            self._pool = ThreadPool(workers)
+
+        return self._pool.map(lambda x: _work(function, x), items,
+                              chunksize=1)
+
+    def run(self, cmd, full_output=False):
+        """Send a command to all HAProxy processes
+
+        :return: list of 2-item tuple, process number and output of command,
+          ordered by process number
+        :rtype: ``list``
+        """
+        return self.commands([(cmd, None)], full_output=full_output)[0]
+
+    def commands(self, cmds, full_output=False, pipeline=False):
+        """Send many commands to HAProxy processes at once
+
+        :param cmds: list of 2-item tuple, command and list of process numbers
+          to send it to, ``None`` sends it to all processes
+        :type cmds: ``list``
+        :param pipeline: send all commands of a process over one connection,
+          which is always done when connections are kept open, unless
+          asyncio is used, which sends every command concurrently instead
+        :type pipeline: ``bool``
+        :return: a list of 2-item tuple, process number and output of command,
+          for every command in the same order as cmds
+        :rtype: ``list``
+        """
+        jobs = []
+        for index, (cmd, process_nbs) in enumerate(cmds):
+            for hap_process in self._hap_processes:
+                process_nb = int(hap_process.process_nb)
+                if process_nbs is None or process_nb in process_nbs:
+                    jobs.append((index, process_nb, hap_process, cmd))
+
+        if self.use_asyncio:
+            from . import aio
+            outputs = aio.run([(x[2].socket_file, x[3]) for x in jobs],
+                              limit=self.parallel or aio.LIMIT,
+                              timeout=self.timeout, tracer=self.tracer)
+            outputs = [_output(lines, full_output, job[2].socket_file)
+                       for lines, job in zip(outputs, jobs)]
+        elif pipeline or self.persistent:
+            # Send all commands of a process in one go, every process is a
+            # single item for the pool of workers.
+            positions = [[i for i, x in enumerate(jobs) if x[2] is hap_process]
+                         for hap_process in self._hap_processes]
+            positions = [x for x in positions if x]
+            outputs = [None] * len(jobs)
+            for _positions, _outputs in zip(positions, self.map(
+                    lambda x: jobs[x[0]][2].commands(
+                        [jobs[i][3] for i in x], full_output=full_output,
+                        pipeline=pipeline),
+                    positions)):
+                for position, output in zip(_positions, _outputs):
+                    outputs[position] = output
+        else:
+            outputs = self.map(
+                lambda x: x[2].command(x[3], full_output=full_output), jobs)
+
+        results = [[] for _ in cmds]
+        for job, output in zip(jobs, outputs):
+            results[job[0]].append((job[1], output))
+
+        return results
+
+    @should_die
+    def command(self, cmd):
+        return self.run(cmd, full_output=True)
+
+    def backends(self, name=None):
+        """Build a list of haproxyadmin Backend objects, the statistics of
+        all processes are read at once"""
+        backends = OrderedDict()
+        for _backends in self.map(lambda x: x.backends(name),
+                                  self._hap_processes):
+            for _backend in _backends:
+                backends.setdefault(_backend.name, []).append(_backend)
+
+        return [Backend(x) for x in backends.values()]
+
+    def frontends(self, name=None):
+        """Build a list of haproxyadmin Frontend objects, the statistics of
+        all processes are read at once"""
+        frontends = OrderedDict()
+        for _frontends in self.map(lambda x: x.frontends(name),
+                                   self._hap_processes):
+            for _frontend in _frontends:
+                frontends.setdefault(_frontend.name, []).append(_frontend)
+
+        return [Frontend(x) for x in frontends.values()]
+
+    def metric(self, name):
+        """Return the value of a metric the same way haproxy.HAProxy does,
+        the metric of all processes is read at once
+
+        :raise: ``ValueError`` when a given metric is not found
+        """
+        if name not in HAPROXY_METRICS:
+            raise ValueError("{} is not valid metric".format(name))
+
+        metrics = (converter(x) for x in self.map(lambda x: x.metric(name),
+                                                  self._hap_processes))
+
+        return calculate(name, [x for x in metrics if x is not None])
+
+    def errors(self, iid=None):
+        if iid:
+            cmd = "show errors {}".format(iid)
+        else:
+            cmd = "show errors"
+
+        return self.run(cmd, full_output=True)
+
+    def info(self):
+        return [info2dict(x[1]) for x in self.run('show info',
+                                                  full_output=True)]
+
+
+def _work(function, item):
+    """Call function for an item of HAProxy.map() in a worker"""
+    _WORKER.busy = True
+    try:
+        return function(item)
+    finally:
+        _WORKER.busy = False
+
+
+def _process(obj):
+    """Return the _Process an object of haproxyadmin belongs to"""
+    if isinstance(obj, _Process):
+        return obj
+    if hasattr(obj, 'hap_process'):
+        # _Backend and _Frontend
+        return obj.hap_process
+    if hasattr(obj, 'backend'):
+        # _Server
+        return _process(obj.backend)
+
+    return None
+
+
+def across_all_procs(hap_objects, method, *args, **kwargs):
+    """Call a method of objects of all processes with HAProxy.map()
+
+    haproxyadmin calls a method of the object of every process one after the
+    other with utils.cmd_across_all_procs, for every read of a property of
+    a frontend, backend or server and for commands such as 'show map'. This
+    function replaces it in haproxyadmin modules, so these calls go through
+    the pool of workers as well.
+
+    :return: list of 2-item tuple, process number and what the method
+      returned, in the same order as hap_objects
+    :rtype: ``list``
+    """
+    def call(obj):
+        return obj.process_nb, getattr(obj, method)(*args, **kwargs)
+
+    hap_objects = list(hap_objects)
+    hap_process = _process(hap_objects[0]) if hap_objects else None
+    if hap_process is None or hap_process.map is None:
+        return [call(x) for x in hap_objects]
+
+    return hap_process.map(call, hap_objects)
+
+
+for _module in (backend, frontend, haproxy, server):
+    _module.cmd_across_all_procs = across_all_procs
+
+
+def socket_address(socket_file):
+    """Return the address family and the address of a stats socket
+
+    :raise: ValueError when the port of a TCP socket isn't a number
+    """
+    if not socket_file.startswith(TCP_PREFIX):
+        return socket.AF_UNIX, socket_file
+    host, _, port = socket_file[len(TCP_PREFIX):].rpartition(':')
+    try:
+        return socket.AF_INET, (host, int(port))
+    except ValueError:
+        raise ValueError("invalid TCP socket {}, expected ipv4@<host>:<port>"
+                         .format(socket_file))
+
+
+def _output(lines, full_output, socket_file):
+    """Return output of a command the same way _HAProxyProcess.command does"""
+    # HAProxy always sends an empty line at the end of the output
+    if len(lines) > 1 and lines[-1] == '':
+        lines.pop()
+    if not lines:
+        raise ValueError("no data returned from socket {}".format(
+            socket_file))
+
+    return lines if full_output else lines[0]
+
+
+def chunks(cmds, size=PIPELINE_SIZE):
+    """Split commands into groups which can be sent over a single line"""
+    chunk = []
+    length = 0
+    for cmd in cmds:
+        if chunk and length + len(cmd) + 1 > size:
+            yield chunk
+            chunk = []
+            length = 0
+        chunk.append(cmd)
+        length += len(cmd) + 1
+    if chunk:
+        yield chunk
@@ -5,17 +5,27 @@
 """Manage servers
 
 Usage:
-    haproxytool server [-D DIR | -F SOCKET] (-A | -r | -s | -e | -R | -p | -W |
-                       -i | -c | -C | -S | -X) [--backend=<name>...] [NAME...]
-    haproxytool server [-D DIR | -F SOCKET] -w VALUE [--backend=<name>...]
-                       [NAME...]
+    haproxytool server [-D DIR | -F SOCKET] (-A | -r | -s | -p | -W | -i | -c |
+                       -C | -S | -X) [--live] [--backend=<name>...]
+                       [--where=EXPR] [NAME...]
+    haproxytool server [-D DIR | -F SOCKET] (-e | -R) [--backend=<name>...]
+                       [--where=EXPR] [NAME...]
+    haproxytool server [-D DIR | -F SOCKET] -w VALUE
+                       [--ramp=DURATION [--steps=N]] [--backend=<name>...]
+                       [--where=EXPR] [NAME...]
     haproxytool server [-D DIR | -F SOCKET] -a VALUE [--backend=<name>...] NAME
     haproxytool server [-D DIR | -F SOCKET] -x VALUE [--backend=<name>...] NAME
     haproxytool server [-D DIR | -F SOCKET] [-f ] (-d | -t | -n)
-                       [--backend=<name>...] [NAME...]
+                       [--backend=<name>...] [--where=EXPR] [NAME...]
+    haproxytool server [-D DIR | -F SOCKET] [-f ] --rolling-drain
+                       [--max-draining=N] [--interval=SECONDS]
+                       [--timeout=SECONDS] [--min-healthy=N]
+                       [--backend=<name>...] [--where=EXPR] [NAME...]
     haproxytool server [-D DIR | -F SOCKET] (-l | -M)
-    haproxytool server [-D DIR | -F SOCKET] -m METRIC [--backend=<name>...]
-                       [NAME...]
+    haproxytool server [-D DIR | -F SOCKET] -m METRIC [--live]
+                       [--backend=<name>...] [--where=EXPR] [NAME...]
+    haproxytool server [-D DIR | -F SOCKET] (--top | --bottom) METRIC [N]
+                       [--backend=<name>...] [--where=EXPR]
 
 
 Arguments:
@@ -23,6 +33,16 @@ Arguments:
     SOCKET  Socket file
     VALUE   Value to set
     METRIC  Name of a metric, use '-M' to get metric names
+    NAME    Name of a server, a glob pattern such as 'web-*' or a regular
+            expression enclosed in slashes such as '/^web-[0-9]+$/', which
+            can also be used for names of backends
+    N       A number, it is the number of servers to show with '--top' and
+            '--bottom' and it is 10 by default
+    SECONDS Number of seconds, fractions are accepted
+    DURATION Number of seconds, or minutes and hours with a m or h suffix
+    EXPR    Comparisons of fields of statistics with values, combined with
+            and, or, not and parentheses, such as 'status==DOWN and
+            scur>100', see 'haproxytool.where' for the syntax
 
 Options:
     -a, --address             set server's address
@@ -36,6 +56,8 @@ Options:
     -h, --help                show this screen
     -i, --sid                 show server ID
     -l, --show                show all servers
+    -L, --live                read each value with a separate command instead
+                              of a single snapshot of statistics
     -m, --metric              show value of a metric
     -M, --show-metrics        show all metrics
     -n, --drain               drain server
@@ -49,33 +71,106 @@ Options:
     -W, --get-weight          show weight of server
     -x --port                 set servers's port
     -X, --show-port           show servers's port
+    --top                     show servers with the largest value of a metric
+    --bottom                  show servers with the smallest value of a metric
+    --ramp=DURATION           change weight gradually over a period of time
+    --steps=N                 number of changes to the weight when it is
+                              changed gradually [default: 10]
+    --rolling-drain           drain servers a few at a time and wait until
+                              they don't have any sessions
+    --max-draining=N          number of servers to drain at the same time
+                              [default: 1]
+    --interval=SECONDS        time between checks for sessions [default: 2]
+    --timeout=SECONDS         time to wait for the sessions of a server to
+                              finish [default: 300]
+    --min-healthy=N           number of servers in a backend which must be
+                              healthy, servers aren't drained below it
+                              [default: 0]
+    --where=EXPR              select only servers whose statistics match
+                              EXPR
     -D DIR, --socket-dir=DIR  directory with HAProxy socket files
                               [default: /var/lib/haproxy]
 
 """
 import sys
-from operator import methodcaller
-from docopt import docopt
+import time
+from collections import OrderedDict
 from haproxyadmin import (SERVER_METRICS, STATE_ENABLE, STATE_DISABLE,
                           STATE_READY, STATE_DRAIN, STATE_MAINT)
 from haproxyadmin.exceptions import (CommandFailed, IncosistentData,
                                      MultipleCommandResults)
-from .utils import get_arg_option, abort_command, haproxy_object
+from haproxyadmin.utils import check_command
+from .usage import docopt
+from .output import note, write
+from .utils import (GLOBAL_OPTIONS, get_arg_option, abort_command,
+                    haproxy_object, positive_number, select)
+
+# Header and row of the table output of servers
+HEADER = "# backendname servername"
+LINE = "{:<30} {:<42} {}"
 
 
 class ServerCommand():
     """Parse and run input from CLI
 
+    Servers are looked up in a single snapshot of statistics unless live
+    reads are requested with '--live'. State and weight changes for all
+    servers are sent to HAProxy at once.
+
     Argument:
         hap (object): A haproxy.HAProxy object
         args (dict): A dictionary returned by docopt afte CLI is parsed
     """
+    # Methods which need haproxyadmin objects rather than a Snapshot
+    LIVE_METHODS = [
+        'address',
+        'port',
+    ]
+    # Methods which need only names, IDs and process numbers of servers,
+    # which are read from the topology cache when it is enabled
+    TOPOLOGY_METHODS = [
+        'show',
+        'sid',
+        'process',
+        'enable',
+        'disable',
+        'ready',
+        'drain',
+        'maintenance',
+        'weight',
+    ]
+
     def __init__(self, hap, args):
+        # Imported only here, usage and help of the command don't need it
+        from .snapshot import Snapshot
         self.hap = hap
         self.args = args
+        method = get_arg_option(args)
+        if args['--live'] or method in self.LIVE_METHODS:
+            self.stats = hap
+        elif (GLOBAL_OPTIONS['--cache'] and method in self.TOPOLOGY_METHODS
+              and args['--ramp'] is None and args['--where'] is None):
+            # The topology cache has no statistics to evaluate --where
+            from .cache import topology
+            self.stats = topology(hap)
+        else:
+            self.stats = Snapshot(hap)
         self.servers = self.build_server_list(
             args['NAME'],
             args['--backend'])
+        if args['--where'] is not None:
+            # Live reads are filtered with a snapshot, which evaluates the
+            # expression over the statistics of all servers read at once
+            stats = self.stats
+            if not isinstance(stats, Snapshot):
+                stats = Snapshot(hap)
+            from .where import where
+            try:
+                self.servers = where(args['--where'], self.servers,
+                                     stats.servers(),
+                                     lambda x: (x.backendname, x.name))
+            except ValueError as error:
+                sys.exit(error)
 
     def address(self):
         value = self.args['VALUE']
@@ -94,66 +189,66 @@ class ServerCommand():
                       .format(server.name, value, server.backendname))
 
     def build_server_list(self, names=None, backends=None):
-        servers = []
+        """Return the servers which match names in backends
+
+        Names and backends can be glob patterns or regular expressions, see
+        utils.name_matcher(). Servers are indexed by name in a single pass,
+        so many names are resolved in linear time.
+        """
+        _backends = self.stats.backends()
+        if backends:
+            try:
+                selected, missing = select((x.name for x in _backends),
+                                           backends)
+            except ValueError as error:
+                sys.exit(error)
+            for backend in missing:
+                note("{} backend was not found".format(backend))
+            selected = set(selected)
+            _backends = [x for x in _backends if x.name in selected]
+
+        servers = [x for backend in _backends for x in backend.servers()]
         if not names:
-            if not backends:
-                for server in self.hap.servers():
-                    servers.append(server)
-            else:
-                for backend in backends:
-                    for server in self.hap.servers(backend):
-                        servers.append(server)
-        else:
-            if not backends:
-                for name in names:
-                    try:
-                        for server in self.hap.server(name):
-                            servers.append(server)
-                    except ValueError:
-                        print("{} was not found".format(name))
-            else:
-                for backend in backends:
-                    for name in names:
-                        try:
-                            for server in self.hap.server(name, backend):
-                                servers.append(server)
-                        except ValueError:
-                            print("{} was not found".format(name))
+            return servers
 
-        return servers
+        index = OrderedDict()
+        for server in servers:
+            index.setdefault(server.name, []).append(server)
+        try:
+            selected, missing = select(index, names)
+        except ValueError as error:
+            sys.exit(error)
+        for name in missing:
+            note("{} was not found".format(name))
+
+        return [x for name in selected for x in index[name]]
+
+    def write_servers(self, column, value):
+        """Write backend name, name and a value of every server
+
+        :param column: name of the value
+        :param value: function which returns the value of a server
+        """
+        write(('backendname', 'servername', column),
+              ((x.backendname, x.name, value(x)) for x in self.servers),
+              LINE, HEADER)
 
     def show(self):
-        print("# backendname servername")
-        for server in self.servers:
-            print("{:<30} {}".format(server.backendname, server.name))
+        write(('backendname', 'servername'),
+              ((x.backendname, x.name) for x in self.servers),
+              "{:<30} {}", HEADER)
 
     def status(self):
-        print("# backendname servername")
-        for server in self.servers:
-            try:
-                status = server.status
-            except IncosistentData as exc:
-                status = exc.results
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            status))
+        self.write_servers('status', lambda x: inconsistent(x, 'status'))
 
     def requests(self):
-        print("# backendname servername")
-        for server in self.servers:
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            server.requests))
+        self.write_servers('requests', lambda x: x.requests)
 
     def sid(self):
-        print("# backendname servername")
-        for server in self.servers:
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            server.sid))
+        self.write_servers('sid', lambda x: x.sid)
 
     def process(self):
-        print("# backendname servername")
-        for server in self.servers:
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            server.process_nb))
+        self.write_servers('process_nb', lambda x: x.process_nb)
 
     def port(self):
         value = self.args['VALUE']
@@ -174,147 +269,370 @@ class ServerCommand():
                 print("set port for {} server to {} in {} backend"
                       .format(server.name, value, server.backendname))
 
-    def enable(self):
-        for server in self.servers:
+    def setstate(self, state, done_msg, failed_msg, servers=None):
+        """Change the state of servers, all selected servers by default
+
+        :return: servers which failed to change state
+        :rtype: ``list``
+        """
+        cmds = []
+        for server in self.servers if servers is None else servers:
+            if state in (STATE_ENABLE, STATE_DISABLE):
+                cmd = "{} server {}/{}".format(state, server.backendname,
+                                               server.name)
+            else:
+                cmd = "set server {}/{} state {}".format(server.backendname,
+                                                         server.name, state)
+            cmds.append((cmd, server.process_nb))
+
+        return self.report(cmds, done_msg, failed_msg, servers)
+
+    def report(self, cmds, done_msg, failed_msg, servers=None):
+        """Send a command per server and report the result for each server
+
+        Commands are sent to every process over a single connection, joined
+        with a semicolon. When all selected servers are changed, it exits with
+        status 1 if the command failed for any server.
+
+        :return: servers for which the command failed
+        :rtype: ``list``
+        """
+        failed = []
+        outputs = self.hap.commands(cmds, pipeline=True)
+        for server, results in zip(
+                self.servers if servers is None else servers, outputs):
             try:
-                server.setstate(STATE_ENABLE)
-                print("{} enabled in {} backend".format(server.name,
-                                                        server.backendname))
+                check_command(results)
+                print(done_msg.format(server.name, server.backendname))
             except CommandFailed as error:
-                print("{} failed to be enabled:{}".format(server.name, error))
+                failed.append(server)
+                print(failed_msg.format(server.name, error))
+        if failed and servers is None:
+            sys.exit(1)
+
+        return failed
+
+    def enable(self):
+        self.setstate(STATE_ENABLE,
+                      "{} enabled in {} backend",
+                      "{} failed to be enabled:{}")
 
     def disable(self):
         if abort_command('disable', 'servers', self.servers,
                          self.args['--force']):
             sys.exit('Aborted by user')
 
-        for server in self.servers:
-            try:
-                server.setstate(STATE_DISABLE)
-                print("{} disabled in {} backend".format(server.name,
-                                                         server.backendname))
-            except CommandFailed as error:
-                print("{} failed to be disabled:{}".format(server.name, error))
+        self.setstate(STATE_DISABLE,
+                      "{} disabled in {} backend",
+                      "{} failed to be disabled:{}")
 
     def ready(self):
-        for server in self.servers:
-            try:
-                server.setstate(STATE_READY)
-                print("{} set to ready in {} backend".format(
-                    server.name, server.backendname))
-            except CommandFailed as error:
-                print("{} failed to set normal state:{}".format(server.name,
-                                                                error))
+        self.setstate(STATE_READY,
+                      "{} set to ready in {} backend",
+                      "{} failed to set normal state:{}")
 
     def drain(self):
         if abort_command('drain', 'servers', self.servers,
                          self.args['--force']):
             sys.exit('Aborted by user')
 
-        for server in self.servers:
-            try:
-                server.setstate(STATE_DRAIN)
-                print("{} set to drain in {} backend".format(
-                    server.name, server.backendname))
-            except CommandFailed as error:
-                print("{} failed to set in drain state:{}".format(server.name,
-                                                                  error))
+        self.setstate(STATE_DRAIN,
+                      "{} set to drain in {} backend",
+                      "{} failed to set in drain state:{}")
 
     def maintenance(self):
         if abort_command('maintenance', 'servers', self.servers,
                          self.args['--force']):
             sys.exit('Aborted by user')
 
-        for server in self.servers:
-            try:
-                server.setstate(STATE_MAINT)
-                print("{} set to maintenance in {} backend".format(
-                    server.name, server.backendname))
-            except CommandFailed as error:
-                print("{} failed to set to maintenance state:{}".format(
-                    server.name, error))
+        self.setstate(STATE_MAINT,
+                      "{} set to maintenance in {} backend",
+                      "{} failed to set to maintenance state:{}")
+
+    def number(self, option, minimum, convert=int):
+        """Return the value of an option as a number"""
+        try:
+            value = convert(self.args[option])
+            if value < minimum:
+                raise ValueError
+        except ValueError:
+            sys.exit("{} expects a number equal or greater than {}, got {}"
+                     .format(option, minimum, self.args[option]))
+
+        return value
+
+    def rollingdrain(self):
+        """Drain servers in waves
+
+        At most --max-draining servers are in drain at the same time. Once a
+        server doesn't have any sessions, or --timeout expires, another one is
+        drained. Sessions and status of all servers are read from a single
+        snapshot of statistics on every check.
+        """
+        max_draining = self.number('--max-draining', 1)
+        min_healthy = self.number('--min-healthy', 0)
+        interval = self.number('--interval', 0, float)
+        timeout = self.number('--timeout', 0, float)
+        if abort_command('drain', 'servers', self.servers,
+                         self.args['--force']):
+            sys.exit('Aborted by user')
+
+        from .snapshot import Snapshot
+        failed = False
+        pending = list(self.servers)
+        # (backend name, server name) to the time it was set to drain
+        draining = {}
+        snapshot = self.stats
+        while True:
+            started = time.time()
+            if not isinstance(snapshot, Snapshot):
+                snapshot = Snapshot(self.hap)
+            servers = dict(((x.backendname, x.name), x)
+                           for x in snapshot.servers())
+            for key, since in list(draining.items()):
+                if key not in servers:
+                    # Removed from HAProxy, it has no sessions to wait for
+                    note("{} is gone from {} backend, considered drained"
+                         .format(key[1], key[0]))
+                    del draining[key]
+                    continue
+                sessions = servers[key].metric('scur')
+                if sessions == 0:
+                    print("{} drained in {} backend after {:.1f} seconds"
+                          .format(key[1], key[0], started - since))
+                    del draining[key]
+                elif started - since >= timeout:
+                    failed = True
+                    print("{} has {} sessions in {} backend after {:.1f} "
+                          "seconds".format(key[1], sessions, key[0],
+                                           started - since))
+                    del draining[key]
+
+            healthy = {}
+            for server in servers.values():
+                if is_healthy(server):
+                    healthy[server.backendname] = (
+                        healthy.get(server.backendname, 0) + 1)
+            wave = []
+            gone = []
+            for server in pending:
+                if len(draining) + len(wave) >= max_draining:
+                    break
+                current = servers.get((server.backendname, server.name))
+                if current is None:
+                    note("{} is gone from {} backend, considered drained"
+                         .format(server.name, server.backendname))
+                    gone.append(server)
+                    continue
+                if is_healthy(current):
+                    if healthy[server.backendname] - 1 < min_healthy:
+                        continue
+                    healthy[server.backendname] -= 1
+                wave.append(server)
+
+            pending = [x for x in pending if x not in gone]
+            if wave:
+                pending = [x for x in pending if x not in wave]
+                errors = self.setstate(STATE_DRAIN,
+                                       "{} set to drain in {} backend",
+                                       "{} failed to set in drain state:{}",
+                                       wave)
+                failed = failed or bool(errors)
+                for server in wave:
+                    if server not in errors:
+                        draining[(server.backendname, server.name)] = (
+                            time.time())
+
+            if not draining:
+                break
+            time.sleep(max(0, interval - (time.time() - started)))
+            snapshot = None
+
+        for server in pending:
+            failed = True
+            print("{} wasn't drained as {} backend would have less than {} "
+                  "healthy servers".format(server.name, server.backendname,
+                                           min_healthy))
+        if failed:
+            sys.exit(1)
 
     def weight(self):
         value = self.args['VALUE']
         try:
             value = int(value)
-            method_caller = methodcaller('setweight', value)
-            for server in self.servers:
+        except ValueError as error:
+            sys.exit("{}".format(error))
+        if not 0 <= value < 256:
+            sys.exit("Invalid weight, absolute weights are permitted between "
+                     "0 and 256")
+
+        if self.args['--ramp'] is not None:
+            self.ramp(value)
+            return
+
+        cmds = [("set weight {}/{} {}".format(server.backendname, server.name,
+                                              value),
+                 server.process_nb)
+                for server in self.servers]
+        self.report(cmds,
+                    "{{}} backend set weight to {} in {{}} backend"
+                    .format(value),
+                    "{} failed to change weight:{}")
+
+    def ramp(self, value):
+        """Change weight of servers to value in steps over a period of time
+
+        Every server starts from its current weight. Steps are scheduled from
+        the start time, so time spent to send commands doesn't add up, and
+        every step sends the commands for all servers which change at once.
+        """
+        duration = parse_duration(self.args['--ramp'])
+        steps = self.number('--steps', 1)
+        weights = []
+        for server in self.servers:
+            try:
+                weights.append((server, int(server.weight)))
+            except (IncosistentData, ValueError):
+                weights.append((server, 0))
+
+        failed = 0
+        start = time.time()
+        for step in range(1, steps + 1):
+            # The 1st step is sent now and the last one after duration
+            if steps > 1:
+                time.sleep(max(0, start + duration * (step - 1) / (steps - 1) -
+                               time.time()))
+            cmds = []
+            changed = []
+            for server, current in weights:
+                weight = ramp_weight(current, value, step / float(steps))
+                if (step == 1 or weight !=
+                        ramp_weight(current, value, (step - 1) / float(steps))):
+                    cmds.append(("set weight {}/{} {}".format(
+                        server.backendname, server.name, weight),
+                                 server.process_nb))
+                    changed.append((server, current))
+            errors = 0
+            outputs = self.hap.commands(cmds, pipeline=True)
+            for (server, current), results in zip(changed, outputs):
                 try:
-                    method_caller(server)
-                    print("{} backend set weight to {} in {} backend".format(
-                        server.name, value, server.backendname))
+                    check_command(results)
                 except CommandFailed as error:
+                    errors += 1
+                    weights.remove((server, current))
                     print("{} failed to change weight:{}".format(server.name,
                                                                  error))
-        except ValueError as error:
-            sys.exit("{}".format(error))
+            failed += errors
+            print("step {}/{}: changed weight of {} servers after {:.1f} "
+                  "seconds".format(step, steps, len(cmds) - errors,
+                                   time.time() - start))
+
+        for server, _ in weights:
+            print("{} backend set weight to {} in {} backend"
+                  .format(server.name, value, server.backendname))
+        if failed:
+            sys.exit(1)
 
     def metric(self):
         metric = self.args['METRIC']
         if metric not in SERVER_METRICS:
             sys.exit("{} no valid metric".format(metric))
 
-        print("# backendname servername")
-        for server in self.servers:
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            server.metric(metric)))
+        self.write_servers(metric, lambda x: x.metric(metric))
+
+    def top(self):
+        self.ranking(largest=True)
+
+    def bottom(self):
+        self.ranking(largest=False)
+
+    def ranking(self, largest):
+        """Show the servers with the largest or smallest value of a metric"""
+        metric = self.args['METRIC']
+        if metric not in SERVER_METRICS:
+            sys.exit("{} no valid metric".format(metric))
+
+        from .snapshot import rank
+        ranked = rank(self.servers, metric,
+                      positive_number(self.args, 'N', 10), largest)
+        write(('backendname', 'servername', metric),
+              ((x.backendname, x.name, value) for value, x in ranked),
+              LINE, HEADER)
 
     def getweight(self):
-        print("# backendname servername")
-        for server in self.servers:
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            server.weight))
+        self.write_servers('weight', lambda x: x.weight)
 
     def showaddress(self):
-        for server in self.servers:
-            try:
-                print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                                server.address))
-            except IncosistentData as exc:
-                sys.exit("{}:{}".format(exc, exc.results))
+        write(('backendname', 'servername', 'address'),
+              ((x.backendname, x.name, consistent(x, 'address'))
+               for x in self.servers),
+              LINE)
 
     def showport(self):
-        for server in self.servers:
-            try:
-                print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                                server.port))
-            except IncosistentData as exc:
-                sys.exit("{}:{}".format(exc, exc.results))
+        write(('backendname', 'servername', 'port'),
+              ((x.backendname, x.name, consistent(x, 'port'))
+               for x in self.servers),
+              LINE)
 
     def showmetrics(self):
-        for metric in SERVER_METRICS:
-            print(metric)
+        write(('metric',), ((x,) for x in SERVER_METRICS))
 
     def showcheckcode(self):
-        print("# backendname servername")
-        for server in self.servers:
-            try:
-                check_code = server.check_code
-            except IncosistentData as exc:
-                check_code = exc.results
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            check_code))
+        self.write_servers('check_code',
+                           lambda x: inconsistent(x, 'check_code'))
 
     def showcheckstatus(self):
-        print("# backendname servername")
-        for server in self.servers:
-            try:
-                check_status = server.check_status
-            except IncosistentData as exc:
-                check_status = exc.results
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            check_status))
+        self.write_servers('check_status',
+                           lambda x: inconsistent(x, 'check_status'))
 
     def showlaststatus(self):
-        print("# backendname servername")
-        for server in self.servers:
-            try:
-                last_status = server.last_status
-            except IncosistentData as exc:
-                last_status = exc.results
-            print("{:<30} {:<42} {}".format(server.backendname, server.name,
-                                            last_status))
+        self.write_servers('last_status',
+                           lambda x: inconsistent(x, 'last_status'))
+
+
+def inconsistent(server, name):
+    """Return a property of a server or the value per process when it is
+    different across processes"""
+    try:
+        return getattr(server, name)
+    except IncosistentData as exc:
+        return exc.results
+
+
+def consistent(server, name):
+    """Return a property of a server, exit when it is different across
+    processes"""
+    try:
+        return getattr(server, name)
+    except IncosistentData as exc:
+        sys.exit("{}:{}".format(exc, exc.results))
+
+
+def ramp_weight(start, end, fraction):
+    """Return the weight at a fraction of the way from start to end"""
+    return int(round(start + (end - start) * fraction))
+
+
+def parse_duration(value):
+    """Return the number of seconds of a duration such as 30, 1.5m or 2h"""
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    try:
+        if value[-1:] in units:
+            return float(value[:-1]) * units[value[-1]]
+        return float(value)
+    except ValueError:
+        sys.exit("invalid duration {}, expected seconds or a number with m or "
+                 "h suffix".format(value))
+
+
+def is_healthy(server):
+    """Return True if a server gets new traffic"""
+    try:
+        status = server.status
+    except IncosistentData:
+        return False
+
+    return status.startswith('UP') or status == 'no check'
 
 
 def main():
@@ -0,0 +1,258 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Build an in-memory view of frontends, backends and servers
+
+haproxyadmin objects run a 'show stat' command against every HAProxy process
+each time a property is accessed. A Snapshot sends a single 'show stat'
+command per process, parses the output once and serves all reads from it.
+Objects returned by a Snapshot provide the same read-only properties as the
+haproxyadmin objects, so they can be used in their place when printing.
+"""
+import heapq
+from collections import OrderedDict
+from haproxyadmin.exceptions import CommandFailed, IncosistentData
+from haproxyadmin.utils import (calculate, compare_values, converter,
+                                elements_of_list_same)
+from .trace import phase
+
+
+class _Stats(object):
+    """Statistics of a single object across HAProxy processes.
+
+    Argument:
+        name (str): Name of the object
+    """
+    def __init__(self, name):
+        self.name = name
+        # a list of (process number, field index, values of CSV line)
+        self._per_proc = []
+
+    def add(self, process_nb, fields, parts):
+        self._per_proc.append((process_nb, fields, parts))
+
+    def values(self, field):
+        """Return a list of (process number, value) for a field"""
+        return [(process_nb, parts[fields[field]])
+                for process_nb, fields, parts in self._per_proc]
+
+    @property
+    def process_nb(self):
+        return [process_nb for process_nb, _, _ in self._per_proc]
+
+    @property
+    def iid(self):
+        return int(self.values('iid')[0][1])
+
+    @property
+    def status(self):
+        return compare_values(self.values('status'))
+
+    def metric(self, name):
+        metrics = (converter(value) for _, value in self.values(name))
+
+        return calculate(name, [x for x in metrics if x is not None])
+
+    def stats_per_process(self):
+        return [(process_nb, dict(zip(fields, parts)))
+                for process_nb, fields, parts in self._per_proc]
+
+
+class Frontend(_Stats):
+    @property
+    def requests(self):
+        return self.metric('req_tot')
+
+    @property
+    def maxconn(self):
+        return self.metric('slim')
+
+
+class Backend(_Stats):
+    def __init__(self, name):
+        super(Backend, self).__init__(name)
+        self._servers = OrderedDict()
+
+    @property
+    def requests(self):
+        return self.metric('stot')
+
+    def add_server(self, process_nb, fields, parts):
+        if parts[1] not in self._servers:
+            self._servers[parts[1]] = Server(parts[1], self.name)
+        self._servers[parts[1]].add(process_nb, fields, parts)
+
+    def servers(self):
+        return list(self._servers.values())
+
+
+class Server(_Stats):
+    def __init__(self, name, backendname):
+        super(Server, self).__init__(name)
+        self.backendname = backendname
+
+    @property
+    def requests(self):
+        return self.metric('stot')
+
+    @property
+    def sid(self):
+        return int(self.values('sid')[0][1])
+
+    @property
+    def weight(self):
+        return converter(compare_values(self.values('weight')))
+
+    @property
+    def check_code(self):
+        return converter(compare_values(self.values('check_code')))
+
+    @property
+    def check_status(self):
+        return compare_values(self.values('check_status'))
+
+    @property
+    def last_status(self):
+        return compare_values(self.values('last_chk'))
+
+    def _addr(self, index):
+        # HAProxy reports address:port, the address or port may be the same
+        # across processes even when the other part is different.
+        values = self.values('addr')
+        try:
+            return compare_values(values).split(':')[index]
+        except IncosistentData as exc:
+            parts = [value.split(':')[index] for _, value in values]
+            if not elements_of_list_same(parts):
+                raise exc
+            return parts[0]
+
+    @property
+    def address(self):
+        return self._addr(0)
+
+    @property
+    def port(self):
+        return self._addr(1)
+
+
+def _fields(header):
+    """Map the field names found in the header line of CSV to their index"""
+    names = header.lstrip('# ').rstrip(',').split(',')
+
+    return dict((name, index) for index, name in enumerate(names))
+
+
+class Snapshot(object):
+    """Statistics of all HAProxy processes taken at once
+
+    Argument:
+        hap (object): A haproxy.HAProxy object
+        outputs (list): output of 'show stat' per process number, it is read
+            from HAProxy when it isn't given
+    """
+    def __init__(self, hap, outputs=None):
+        self._frontends = OrderedDict()
+        self._backends = OrderedDict()
+        self.roundtrips = 0
+        if outputs is None:
+            outputs = hap.command('show stat')
+            self.roundtrips = len(outputs)
+        with phase(hap.tracer, 'parse'):
+            for process_nb, csv_data in outputs:
+                self.parse(int(process_nb), csv_data)
+
+    def parse(self, process_nb, csv_data):
+        """Add the output of 'show stat' command of a HAProxy process
+
+        We need to parse the following
+        # pxname,svname,qcur,...
+        app_com,FRONTEND,,,0...
+        app_com,appfe-103.foo.com,0,...
+        app_com,BACKEND,0,0,...
+        """
+        if not csv_data or not csv_data[0].startswith('#'):
+            raise CommandFailed(csv_data[0] if csv_data else 'no data')
+
+        fields = _fields(csv_data[0])
+        for line in csv_data[1:]:
+            if not line:
+                continue
+            parts = line.split(',')
+            if parts[1] == 'FRONTEND':
+                if parts[0] not in self._frontends:
+                    self._frontends[parts[0]] = Frontend(parts[0])
+                self._frontends[parts[0]].add(process_nb, fields, parts)
+                continue
+
+            if parts[0] not in self._backends:
+                self._backends[parts[0]] = Backend(parts[0])
+            backend = self._backends[parts[0]]
+            if parts[1] == 'BACKEND':
+                backend.add(process_nb, fields, parts)
+            else:
+                backend.add_server(process_nb, fields, parts)
+
+    def frontends(self, name=None):
+        if name is None:
+            return list(self._frontends.values())
+
+        return [x for x in [self._frontends.get(name)] if x is not None]
+
+    def frontend(self, name):
+        try:
+            return self._frontends[name]
+        except KeyError:
+            raise ValueError("Could not find frontend")
+
+    def backends(self, name=None):
+        if name is None:
+            return list(self._backends.values())
+
+        return [x for x in [self._backends.get(name)] if x is not None]
+
+    def backend(self, name):
+        try:
+            return self._backends[name]
+        except KeyError:
+            raise ValueError("Could not find backend")
+
+    def servers(self, backend=None):
+        servers = []
+        for _backend in self.backends(backend):
+            servers.extend(_backend.servers())
+
+        return servers
+
+    def server(self, hostname, backend=None):
+        servers = [x for x in self.servers(backend) if x.name == hostname]
+        if not servers:
+            raise ValueError("Could not find server")
+
+        return servers
+
+
+def rank(objects, metric, count, largest=True):
+    """Return the objects with the largest or smallest value of a metric
+
+    Values are aggregated across processes by the metric of every object. A
+    heap keeps only count objects, so it takes O(n log count) time. Objects
+    with the same value are returned in their original order and objects
+    without a numeric value are skipped.
+
+    :return: list of 2-item tuple, value and object
+    :rtype: ``list``
+    """
+    def values():
+        for obj in objects:
+            try:
+                value = obj.metric(metric)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(value, (int, float)):
+                yield value, obj
+
+    if largest:
+        return heapq.nlargest(count, values(), key=lambda x: x[0])
+
+    return heapq.nsmallest(count, values(), key=lambda x: x[0])
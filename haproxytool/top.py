@@ -0,0 +1,229 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Show live rates of frontends, backends or servers
+
+Usage:
+    haproxytool top [-D DIR | -F SOCKET] [-f | -b | -s] [-i SECONDS]
+                    [-n N] [-o COLUMN] [-l N] [NAME...]
+
+Arguments:
+    DIR     Directory path with socket files
+    SOCKET  Socket file
+    SECONDS Number of seconds, fractions are accepted
+    N       A number
+    COLUMN  One of name, status, scur, sess/s, req/s, in/s, out/s, err/s and
+            5xx/s
+    NAME    Name of a frontend, backend or server, a glob pattern such as
+            'web-*' or a regular expression enclosed in slashes such as
+            '/^web-[0-9]+$/'
+
+Options:
+    -b, --backends            show backends
+    -f, --frontends           show frontends, which is the default
+    -F SOCKET, --file SOCKET  socket file
+    -h, --help                show this screen
+    -i SECONDS, --interval SECONDS  time between refreshes [default: 2]
+    -l N, --lines N           number of rows to show, all rows fit in the
+                              terminal by default
+    -n N, --iterations N      number of refreshes before exiting, it runs until
+                              it is interrupted by default
+    -o COLUMN, --sort COLUMN  column to sort rows by, name is sorted in
+                              ascending order and the rest in descending order
+                              [default: req/s]
+    -s, --servers             show servers
+    -D DIR, --socket-dir=DIR  directory with HAProxy socket files
+                              [default: /var/lib/haproxy]
+
+"""
+import sys
+import time
+import heapq
+import shutil
+
+from .snapshot import Snapshot
+from .usage import docopt
+from .utils import haproxy_object, positive_number, select
+
+# Object type of 'show stat' for every kind of objects
+OBJECT_TYPES = {
+    'frontends': 1,
+    'backends': 2,
+    'servers': 4,
+}
+# Columns with the counter their rate is calculated from, errors are the sum
+# of several counters and they are different for frontends
+RATES = [
+    ('sess/s', ['stot']),
+    ('req/s', ['req_tot']),
+    ('in/s', ['bin']),
+    ('out/s', ['bout']),
+    ('err/s', ['econ', 'eresp']),
+    ('5xx/s', ['hrsp_5xx']),
+]
+FRONTEND_ERRORS = ['ereq']
+COLUMNS = ['name', 'status', 'scur'] + [x[0] for x in RATES]
+# Escape sequence which moves the cursor home and clears the screen
+CLEAR = '\033[H\033[J'
+
+
+def human(value):
+    """Return a number in a short form, such as 1.2K or 3.4M"""
+    if value is None:
+        return '-'
+    for unit in ('', 'K', 'M', 'G'):
+        if abs(value) < 1000:
+            if unit == '' and value == int(value):
+                return "{}".format(int(value))
+            return "{:.1f}{}".format(value, unit)
+        value /= 1000.0
+
+    return "{:.1f}T".format(value)
+
+
+def terminal_lines():
+    """Return the number of lines of the terminal"""
+    try:
+        return shutil.get_terminal_size().lines
+    except AttributeError:
+        # Python 2
+        return 24
+
+
+class Sample(object):
+    """Counters of frontends, backends or servers at a point in time
+
+    Argument:
+        hap (object): A runtime.HAProxy object
+        kind (str): frontends, backends or servers
+        names (list): names or patterns of the objects to show
+    """
+    def __init__(self, hap, kind, names):
+        self.time = time.time()
+        outputs = hap.command("show stat -1 {} -1".format(OBJECT_TYPES[kind]))
+        snapshot = Snapshot(hap, outputs)
+        objects = getattr(snapshot, kind)()
+        if kind == 'servers':
+            self.names = ["{}/{}".format(x.backendname, x.name)
+                          for x in objects]
+        else:
+            self.names = [x.name for x in objects]
+        if names:
+            # Servers are matched by their name without the backend
+            selected = set(select((x.name for x in objects), names)[0])
+            self.names = [x for x, y in zip(self.names, objects)
+                          if y.name in selected]
+            objects = [x for x in objects if x.name in selected]
+        self.rows = {}
+        for name, obj in zip(self.names, objects):
+            status = sorted(set(x[1] for x in obj.values('status')))
+            counters = {}
+            for column, fields in RATES:
+                if column == 'err/s' and kind == 'frontends':
+                    fields = FRONTEND_ERRORS
+                counters[column] = sum(obj.metric(x) for x in fields)
+            self.rows[name] = ('/'.join(status), obj.metric('scur'), counters)
+
+
+def rates(previous, current):
+    """Return the rows of the table from two samples
+
+    A rate isn't known for objects which weren't in the previous sample and
+    for counters which went backwards, as it happens when HAProxy is reloaded
+    or counters are cleared.
+    """
+    elapsed = current.time - previous.time
+    rows = []
+    for name in current.names:
+        status, scur, counters = current.rows[name]
+        row = {'name': name, 'status': status, 'scur': scur}
+        before = previous.rows.get(name)
+        for column, _ in RATES:
+            row[column] = None
+            if before is not None and counters[column] >= before[2][column]:
+                row[column] = (counters[column] - before[2][column]) / elapsed
+        rows.append(row)
+
+    return rows
+
+
+def sort(rows, column, limit):
+    """Return up to limit rows sorted by column"""
+    if column == 'name':
+        return heapq.nsmallest(limit, rows, key=lambda x: x['name'])
+
+    # Unknown rates go last
+    return heapq.nlargest(
+        limit, rows,
+        key=lambda x: -1 if x[column] is None else x[column])
+
+
+def draw(rows, header, width):
+    """Return the lines of a frame"""
+    lines = [header]
+    lines.append("{:<{width}} {:>10} {:>7} {:>8} {:>8} {:>8} {:>8} {:>7} "
+                 "{:>7}".format(*COLUMNS, width=width))
+    for row in rows:
+        lines.append("{:<{width}} {:>10} {:>7} {:>8} {:>8} {:>8} {:>8} {:>7} "
+                     "{:>7}".format(row['name'][:width], row['status'][:10],
+                                    row['scur'],
+                                    *[human(row[x[0]]) for x in RATES],
+                                    width=width))
+
+    return lines
+
+
+def main():
+    arguments = docopt(__doc__)
+    kind = 'frontends'
+    for option in ('--backends', '--servers'):
+        if arguments[option]:
+            kind = option.lstrip('-')
+    if arguments['--sort'] not in COLUMNS:
+        sys.exit("--sort expects one of {}, got {}".format(
+            ', '.join(COLUMNS), arguments['--sort']))
+    try:
+        interval = float(arguments['--interval'])
+        if interval <= 0:
+            raise ValueError
+    except ValueError:
+        sys.exit("--interval expects a positive number, got {}"
+                 .format(arguments['--interval']))
+    iterations = positive_number(arguments, '--iterations', None)
+    lines = positive_number(arguments, '--lines', None)
+    interactive = sys.stdout.isatty()
+
+    hap = haproxy_object(arguments)
+    previous = Sample(hap, kind, arguments['NAME'])
+    refreshes = 0
+    try:
+        while iterations is None or refreshes < iterations:
+            # Sleep until the next refresh is due, the time it takes to read
+            # statistics doesn't add up
+            time.sleep(max(0, previous.time + interval - time.time()))
+            current = Sample(hap, kind, arguments['NAME'])
+            rows = rates(previous, current)
+            limit = lines
+            if limit is None:
+                limit = terminal_lines() - 3 if interactive else len(rows)
+            width = max([len(x) for x in current.names] + [4])
+            header = ("{} - {} {}, {} processes, every {}s, sorted by {}"
+                      .format(time.strftime('%H:%M:%S'), len(rows), kind,
+                              len(hap.process_nbs), interval,
+                              arguments['--sort']))
+            frame = draw(sort(rows, arguments['--sort'], max(limit, 0)),
+                         header, min(width, 60))
+            if interactive:
+                sys.stdout.write(CLEAR)
+            else:
+                frame.append('')
+            sys.stdout.write('\n'.join(frame) + '\n')
+            sys.stdout.flush()
+            previous = current
+            refreshes += 1
+    except KeyboardInterrupt:
+        pass
+
+# This is the standard boilerplate that calls the main() function.
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Record the commands sent to HAProxy and where the time of a run goes
+
+A Tracer is given to runtime.HAProxy, which records every round trip to a
+HAProxy process: the commands sent in a line, the socket file, bytes sent
+and received and the latency. Time is split in phases, connect is the
+discovery of HAProxy processes, socket is the time at least one command is
+in flight, parse is the parsing of statistics and other is the rest, which
+is mostly processing and printing.
+"""
+import sys
+import json
+import math
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Set by cli.main() when tracing is enabled
+TRACER = None
+
+
+class Tracer(object):
+    """Record round trips to HAProxy processes and phases of a run"""
+    def __init__(self):
+        self.start = time.time()
+        self.roundtrips = []
+        self.phases = OrderedDict()
+        self._phase = None
+        self._lock = threading.Lock()
+
+    def record(self, socket_file, cmds, bytes_out, bytes_in, start):
+        """Record a round trip which started at start and finished now
+
+        :param cmds: commands sent in a single line
+        :type cmds: ``list``
+        :param bytes_in: bytes received, ``None`` when they aren't known
+        """
+        end = time.time()
+        with self._lock:
+            self.roundtrips.append({
+                'socket_file': socket_file,
+                'commands': list(cmds),
+                'bytes_out': bytes_out,
+                'bytes_in': bytes_in,
+                'start': start - self.start,
+                'latency': end - start,
+                'phase': self._phase,
+            })
+
+    @contextmanager
+    def phase(self, name):
+        """Add the time spent in the block to a phase"""
+        self._phase = name
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = (self.phases.get(name, 0) +
+                                 time.time() - start)
+            self._phase = None
+
+    def socket_time(self):
+        """Return the time at least one command was in flight outside of
+        other phases"""
+        total = 0
+        end = None
+        for start, stop in sorted(
+                (x['start'], x['start'] + x['latency'])
+                for x in self.roundtrips if x['phase'] is None):
+            if end is None or start > end:
+                total += stop - start
+                end = stop
+            elif stop > end:
+                total += stop - end
+                end = stop
+
+        return total
+
+    def times(self):
+        """Return the time per phase, including socket and other"""
+        total = time.time() - self.start
+        times = OrderedDict(self.phases)
+        times['socket'] = self.socket_time()
+        times['other'] = max(0, total - sum(times.values()))
+        times['total'] = total
+
+        return times
+
+    def summary(self):
+        """Return the report which is printed at exit as a list of lines"""
+        latencies = [x['latency'] for x in self.roundtrips]
+        lines = ["# {} round trips, {} commands, {} bytes sent, {} bytes "
+                 "received".format(
+                     len(self.roundtrips),
+                     sum(len(x['commands']) for x in self.roundtrips),
+                     sum(x['bytes_out'] for x in self.roundtrips),
+                     sum(x['bytes_in'] or 0 for x in self.roundtrips))]
+        if latencies:
+            lines.append("# latency p50 {:.2f}ms p99 {:.2f}ms max {:.2f}ms"
+                         .format(percentile(latencies, 50) * 1000,
+                                 percentile(latencies, 99) * 1000,
+                                 max(latencies) * 1000))
+        lines.append("# time {}".format(', '.join(
+            "{} {:.3f}s".format(name, value)
+            for name, value in self.times().items())))
+
+        by_command = OrderedDict()
+        for roundtrip in self.roundtrips:
+            name = ' '.join(roundtrip['commands'][0].split()[:2])
+            by_command.setdefault(name, []).append(roundtrip)
+        lines.append("# {:<28} {:>8} {:>8} {:>10} {:>9} {:>9}".format(
+            'command', 'trips', 'commands', 'total(ms)', 'p50(ms)',
+            'p99(ms)'))
+        for name, roundtrips in sorted(
+                by_command.items(),
+                key=lambda x: -sum(y['latency'] for y in x[1])):
+            latencies = [x['latency'] for x in roundtrips]
+            lines.append("# {:<28} {:>8} {:>8} {:>10.2f} {:>9.2f} {:>9.2f}"
+                         .format(name, len(roundtrips),
+                                 sum(len(x['commands']) for x in roundtrips),
+                                 sum(latencies) * 1000,
+                                 percentile(latencies, 50) * 1000,
+                                 percentile(latencies, 99) * 1000))
+
+        return lines
+
+    def report(self, path=None, stream=sys.stderr):
+        """Print the summary and save all round trips to a JSON file"""
+        for line in self.summary():
+            stream.write(line + '\n')
+        if path is not None:
+            with open(path, 'w') as file_handle:
+                json.dump({'times': self.times(),
+                           'roundtrips': self.roundtrips},
+                          file_handle, indent=2)
+
+
+def percentile(values, percent):
+    """Return a percentile of values with the nearest rank method"""
+    values = sorted(values)
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+@contextmanager
+def phase(tracer, name):
+    """Run a block in a phase of tracer, tracer can be ``None``"""
+    if tracer is None:
+        yield
+    else:
+        with tracer.phase(name):
+            yield
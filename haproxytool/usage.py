@@ -0,0 +1,129 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Parse command line arguments with docopt without parsing usage every time
+
+docopt builds a pattern from the usage text on every call, which takes
+longer than sending a command to HAProxy for the larger usage texts of
+commands. The pattern is built once per usage text and kept in memory, which
+helps commands which parse arguments many times in a process, such as batch,
+and it isn't built at all when help or version is asked.
+
+Building the pattern relies on functions of docopt 0.6, other versions of
+docopt are called as they are.
+"""
+import sys
+from collections import Counter
+
+import docopt as _docopt
+
+# Patterns built in this process by usage text
+PATTERNS = {}
+# Types of the branches of a pattern in the order Pattern.either of docopt
+# expands them
+BRANCHES = (_docopt.Either, _docopt.Required, _docopt.Optional,
+            getattr(_docopt, 'AnyOptions', None), _docopt.OneOrMore)
+
+
+def build(doc):
+    """Return options and the pattern of a usage text, the pattern isn't
+    fixed yet"""
+    options = _docopt.parse_defaults(doc)
+    pattern = _docopt.parse_pattern(
+        _docopt.formal_usage(_docopt.printable_usage(doc)), options)
+    pattern_options = set(pattern.flat(_docopt.Option))
+    for any_options in pattern.flat(_docopt.AnyOptions):
+        any_options.children = list(set(_docopt.parse_defaults(doc)) -
+                                    pattern_options)
+
+    return options, pattern
+
+
+def cases(pattern):
+    """Return the leaves of every case of a pattern the same way
+    Pattern.either of docopt does"""
+    result = []
+    groups = [[pattern]]
+    while groups:
+        children = groups.pop(0)
+        types = [type(x) for x in children]
+        branch = next((x for x in BRANCHES if x in types), None)
+        if branch is None:
+            result.append(children)
+            continue
+        child = children.pop(types.index(branch))
+        if branch is _docopt.Either:
+            groups.extend([x] + children for x in child.children)
+        elif branch is _docopt.OneOrMore:
+            groups.append(list(child.children) * 2 + children)
+        else:
+            groups.append(list(child.children) + children)
+
+    return result
+
+
+def fix_identities(pattern, leaves):
+    """Make equal leaves of a pattern the same object"""
+    for index, child in enumerate(pattern.children):
+        if hasattr(child, 'children'):
+            fix_identities(child, leaves)
+        else:
+            pattern.children[index] = leaves[repr(child)]
+
+
+def fix(pattern):
+    """Return the pattern fixed the same way as Pattern.fix of docopt
+
+    docopt finds equal nodes by comparing the repr() of every node with the
+    others, which takes most of the time to parse the larger usage texts.
+    Leaves are looked up by their repr() and counted by identity instead.
+    """
+    leaves = {}
+    for leaf in pattern.flat():
+        leaves.setdefault(repr(leaf), leaf)
+    fix_identities(pattern, leaves)
+    for case in cases(pattern):
+        counts = Counter(id(x) for x in case)
+        for leaf in [x for x in case if counts[id(x)] > 1]:
+            if (type(leaf) is _docopt.Argument or
+                    type(leaf) is _docopt.Option and leaf.argcount):
+                if leaf.value is None:
+                    leaf.value = []
+                elif type(leaf.value) is not list:
+                    leaf.value = leaf.value.split()
+            if (type(leaf) is _docopt.Command or
+                    type(leaf) is _docopt.Option and leaf.argcount == 0):
+                leaf.value = 0
+
+    return pattern
+
+
+def docopt(doc, argv=None, help=True, version=None, options_first=False):
+    # pylint: disable=redefined-builtin
+    """Parse argv the same way docopt.docopt does"""
+    if not _docopt.__version__.startswith('0.6.'):
+        return _docopt.docopt(doc, argv, help, version, options_first)
+    if argv is None:
+        argv = sys.argv[1:]
+    _docopt.DocoptExit.usage = _docopt.printable_usage(doc)
+    if doc in PATTERNS:
+        options, pattern = PATTERNS[doc]
+    else:
+        options, pattern = build(doc)
+
+    argv = _docopt.parse_argv(_docopt.TokenStream(argv, _docopt.DocoptExit),
+                              list(options), options_first)
+    # Fixing the pattern takes longer than the rest for the larger usage
+    # texts, help and version exit before it
+    _docopt.extras(help, version, argv, doc)
+    if doc not in PATTERNS:
+        pattern = fix(pattern)
+        PATTERNS[doc] = options, pattern
+    matched, left, collected = pattern.match(argv)
+    if matched and left == []:
+        # Default values of repeated arguments are lists of the pattern,
+        # callers get a copy so the pattern can be used again
+        return _docopt.Dict((a.name, list(a.value)
+                             if isinstance(a.value, list) else a.value)
+                            for a in (pattern.flat() + collected))
+    raise _docopt.DocoptExit()
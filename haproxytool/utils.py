@@ -1,27 +1,135 @@
 # vim:fenc=utf-8
+import re
 import sys
+import fnmatch
+from collections import OrderedDict
 from six.moves import input
-from haproxyadmin import haproxy
 from haproxyadmin.exceptions import (SocketApplicationError,
                                      SocketConnectionError,
-                                     SocketPermissionError)
+                                     SocketPermissionError,
+                                     SocketTimeout)
+
+# Options passed to haproxytool before the command, they are set by cli.main()
+GLOBAL_OPTIONS = {
+    '--asyncio': False,
+    '--cache': False,
+    '--output': 'table',
+    '--parallel': None,
+    '--persistent': False,
+    '--profile': None,
+    '--trace': False,
+}
+
+# HAProxy objects created so far, operations of batch command which use the
+# same socket files share them
+HAPROXY_OBJECTS = {}
+
+# Characters which make a name a glob pattern
+GLOB_CHARS = re.compile(r'[*?[]')
+
+# Options which modify an operation rather than select one
+MODIFIERS = ['--dry-run', '--force', '--live']
 
 
 def get_arg_option(args):
     for key, value in args.items():
-        if (key != '--force' and key.startswith('--') and
+        if (key not in MODIFIERS and key.startswith('--') and
                 isinstance(value, bool) and value):
             return key.replace('-', '')
 
 
+def name_matcher(selector):
+    """Return a function which matches names against a selector
+
+    A selector is a glob pattern, such as web-*, or a regular expression
+    enclosed in slashes, such as /^web-[0-9]+$/.
+
+    :return: ``None`` if selector is a plain name
+    :raise: ValueError when the regular expression is invalid
+    """
+    if len(selector) > 2 and selector[0] == '/' and selector[-1] == '/':
+        try:
+            return re.compile(selector[1:-1]).search
+        except re.error as error:
+            raise ValueError("invalid regular expression {}: {}"
+                             .format(selector, error))
+    if GLOB_CHARS.search(selector):
+        return re.compile(fnmatch.translate(selector)).match
+
+    return None
+
+
+def select(names, selectors):
+    """Return the names which match any of the selectors
+
+    Plain names are looked up in a set, so many of them are resolved in
+    linear time, patterns are matched against every name once.
+
+    :param names: names to select from
+    :type names: ``iterable``
+    :param selectors: names or patterns, see name_matcher()
+    :type selectors: ``list``
+    :return: 2-item tuple, a list of matching names in the order of selectors
+      and a list of selectors which didn't match any name
+    :rtype: ``tuple``
+    """
+    names = list(OrderedDict.fromkeys(names))
+    known = set(names)
+    selected = OrderedDict()
+    missing = []
+    for selector in selectors:
+        matcher = name_matcher(selector)
+        if matcher is None:
+            found = [selector] if selector in known else []
+        else:
+            found = [x for x in names if matcher(x)]
+        if not found:
+            missing.append(selector)
+        for name in found:
+            selected[name] = True
+
+    return list(selected), missing
+
+
+def positive_number(args, name, default):
+    """Return the value of an argument as a positive number
+
+    :param default: value when the argument isn't given
+    :return: the number or exit main program when it isn't a positive number
+    :rtype: ``int``
+    """
+    if args[name] is None:
+        return default
+    try:
+        value = int(args[name])
+        if value < 1:
+            raise ValueError
+    except ValueError:
+        sys.exit("{} expects a positive number, got {}".format(name,
+                                                             args[name]))
+
+    return value
+
+
 def read_user(msg):
     """Read user input.
 
+    The message is prompted only when standard input is a terminal, so it
+    doesn't end up in the output when the answer is piped or there is none,
+    such as in batch command.
+
     :param msg: A message to prompt
     :type msg: ``str``
     :return: ``True`` if user gives 'y' otherwhise False.
     :rtype: ``bool``
+    :raise: EOFError when standard input is closed
     """
+    if not sys.stdin.isatty():
+        user_input = sys.stdin.readline()
+        if not user_input:
+            raise EOFError
+        return user_input.rstrip('\n') == 'y'
+
     user_input = input("{msg} y/n?: ".format(msg=msg))
     return user_input == 'y'
 
@@ -49,18 +157,31 @@ def haproxy_object(arguments):
     :param arguments: Arguments of the progam
     :type arguments: ``dict``
     :return: A HAProxy object or exit main program in case of failure
-    :rtype: ``haproxy.HAProxy``
+    :rtype: ``runtime.HAProxy``
     """
     if arguments['--file'] is not None:
         arguments['--socket-dir'] = None
+    key = (arguments['--file'], arguments['--socket-dir'])
+    if key in HAPROXY_OBJECTS:
+        return HAPROXY_OBJECTS[key]
+    # Imported only here, so usage and help of commands don't pay for them
+    from . import trace
+    from .runtime import HAProxy
     try:
-        hap = haproxy.HAProxy(socket_file=arguments['--file'],
-                              socket_dir=arguments['--socket-dir'])
+        with trace.phase(trace.TRACER, 'connect'):
+            hap = HAProxy(socket_file=arguments['--file'],
+                          socket_dir=arguments['--socket-dir'],
+                          parallel=GLOBAL_OPTIONS['--parallel'],
+                          use_asyncio=GLOBAL_OPTIONS['--asyncio'],
+                          persistent=GLOBAL_OPTIONS['--persistent'],
+                          tracer=trace.TRACER)
     except (SocketApplicationError,
             SocketConnectionError,
-            SocketPermissionError) as error:
-        sys.exit(1)
+            SocketPermissionError,
+            SocketTimeout) as error:
+        sys.exit(error)
     except ValueError as error:
         sys.exit(error)
     else:
+        HAPROXY_OBJECTS[key] = hap
         return hap
@@ -0,0 +1,221 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=superfluous-parens
+"""Select frontends, backends and servers with an expression
+
+An expression compares fields of 'show stat' with values and combines the
+comparisons with and, or, not and parentheses::
+
+    status==DOWN and scur>100
+    not (weight==0 or status~'MAINT*')
+    name~/^web-[0-9]+$/ and qcur>0
+
+Operators are ==, !=, <, <=, > and >=, which need an integer, and ~, which
+matches a glob pattern or a regular expression enclosed in slashes. A value
+with spaces or operators is quoted with single or double quotes. The name
+field is the name of the object. Metrics, such as scur and qcur, are summed
+or averaged across HAProxy processes the same way '-m' does, other fields
+such as status match when the value of any process matches.
+
+An expression is compiled once to a function, which is called for every
+object of a Snapshot.
+"""
+import re
+import operator
+
+from haproxyadmin.utils import METRICS_AVG, METRICS_SUM, converter
+
+from .utils import name_matcher
+
+TOKEN = re.compile(r'''\s*(?:
+    (?P<paren>[()])|
+    (?P<op>==|!=|<=|>=|<|>|~)|
+    (?P<quoted>"[^"]*"|'[^']*')|
+    (?P<word>[^\s()=!<>~"']+)
+    )''', re.VERBOSE)
+ORDERING = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+METRICS = frozenset(METRICS_SUM + METRICS_AVG)
+
+
+def tokenize(expression):
+    """Return a list of 2-item tuple, kind and text of every token"""
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN.match(expression, position)
+        if match is None or match.end() == position:
+            raise ValueError("invalid expression at '{}'"
+                             .format(expression[position:].strip()))
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == 'quoted':
+            kind, text = 'word', text[1:-1]
+        tokens.append((kind, text))
+        position = match.end()
+
+    return tokens
+
+
+def values(obj, field):
+    """Return the values of a field of an object across processes
+
+    :raise: KeyError when HAProxy doesn't report the field
+    """
+    if field == 'name':
+        return [obj.name]
+    if field in METRICS:
+        return [obj.metric(field)]
+
+    return set(converter(x) for _, x in obj.values(field))
+
+
+def integer(value):
+    """Return value as an integer, ``None`` when it isn't one
+
+    converter() of haproxyadmin truncates numbers with a fraction, 1.5 would
+    compare as 1.
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def comparison(field, op, value):
+    """Return a function which compares a field of an object with value
+
+    :raise: ValueError when op needs an integer and value isn't one
+    """
+    if op in ORDERING:
+        number = integer(value)
+        if number is None:
+            raise ValueError("{}{}{}: {} expects a number"
+                             .format(field, op, value, op))
+        function = ORDERING[op]
+
+        def test(current):
+            return isinstance(current, int) and function(current, number)
+    elif op == '~':
+        matcher = name_matcher(value) or (lambda x: x == value)
+
+        def test(current):
+            return current is not None and bool(matcher("{}".format(current)))
+    else:
+        number = integer(value)
+        expected = True if op == '==' else False
+
+        def test(current):
+            if isinstance(current, int) and isinstance(number, int):
+                return (current == number) is expected
+            return ("{}".format('' if current is None else current) ==
+                    value) is expected
+
+    def compare(obj):
+        try:
+            return any(test(x) for x in values(obj, field))
+        except KeyError:
+            raise ValueError("unknown field {}".format(field))
+
+    return compare
+
+
+class Parser(object):
+    """Compile an expression to a function with recursive descent
+
+    Argument:
+        expression (str): An expression, see the docstring of the module
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self, kind, text=None):
+        """Consume the next token if it is of kind and text"""
+        token = self.peek()
+        if token[0] == kind and (text is None or token[1] == text):
+            self.position += 1
+            return token[1]
+        return None
+
+    def error(self):
+        token = self.peek()
+        if token[0] is None:
+            return ValueError("unexpected end of expression '{}'"
+                              .format(self.expression))
+        return ValueError("unexpected '{}' in expression '{}'"
+                          .format(token[1], self.expression))
+
+    def parse(self):
+        function = self.disjunction()
+        if self.peek()[0] is not None:
+            raise self.error()
+        return function
+
+    def disjunction(self):
+        functions = [self.conjunction()]
+        while self.take('word', 'or') is not None:
+            functions.append(self.conjunction())
+        if len(functions) == 1:
+            return functions[0]
+        return lambda obj: any(x(obj) for x in functions)
+
+    def conjunction(self):
+        functions = [self.negation()]
+        while self.take('word', 'and') is not None:
+            functions.append(self.negation())
+        if len(functions) == 1:
+            return functions[0]
+        return lambda obj: all(x(obj) for x in functions)
+
+    def negation(self):
+        if self.take('word', 'not') is not None:
+            function = self.negation()
+            return lambda obj: not function(obj)
+        if self.take('paren', '(') is not None:
+            function = self.disjunction()
+            if self.take('paren', ')') is None:
+                raise self.error()
+            return function
+
+        field = self.take('word')
+        op = self.take('op')
+        value = self.take('word')
+        if field is None or op is None or value is None:
+            raise self.error()
+        return comparison(field, op, value)
+
+
+def compile_expression(expression):
+    """Return a function which returns True for objects which match
+
+    :raise: ValueError when the expression is invalid
+    """
+    return Parser(expression).parse()
+
+
+def where(expression, objects, stats, key):
+    """Return the objects whose statistics match an expression
+
+    :param objects: objects to filter, haproxyadmin or Snapshot objects
+    :param stats: the objects of the same type from a Snapshot
+    :param key: function which returns what identifies an object, such as
+      its name
+    :raise: ValueError when the expression is invalid or it uses a field
+      which HAProxy doesn't report
+    """
+    match = compile_expression(expression)
+    keys = set(key(x) for x in stats if match(x))
+
+    return [x for x in objects if key(x) in keys]
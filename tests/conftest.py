@@ -0,0 +1,50 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import fakehap  # noqa: E402 pylint: disable=wrong-import-position
+
+
+class FakeHAProxy(object):
+    tracer = None
+
+
+@pytest.fixture
+def fake_haproxy():
+    """HAProxy object for a Snapshot of lines of 'show stat' given by a
+    test"""
+    return FakeHAProxy()
+
+
+@pytest.fixture(scope='session')
+def socket_dir(tmp_path_factory):
+    """Directory with the sockets of a fake HAProxy with 2 processes"""
+    directory = str(tmp_path_factory.mktemp('sockets'))
+    fakehap.start(directory, nbproc=2, frontends=2, backends=2, servers=3,
+                  map_entries=10, large_map_entries=0, acl_entries=10)
+
+    return directory
+
+
+@pytest.fixture
+def haproxytool():
+    """Return a function which runs haproxytool and returns its exit status,
+    standard output and standard error"""
+    def run(*args):
+        proc = subprocess.Popen([sys.executable, '-m', 'haproxytool.cli'] +
+                                list(args), cwd=ROOT, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE)
+        stdout, stderr = proc.communicate(b'')
+
+        return proc.returncode, stdout.decode(), stderr.decode()
+
+    return run
@@ -0,0 +1,27 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+from haproxytool import batch, dump
+
+
+def test_confirmation_is_not_prompted(haproxytool, socket_dir, tmp_path):
+    operations = tmp_path / 'operations'
+    operations.write_text(u"server -d server0 server1 --backend backend0\n"
+                          u"server -s server0 --backend backend0\n")
+    status, stdout, _ = haproxytool('batch', '-D', socket_dir,
+                                    str(operations))
+    assert status == 1
+    assert 'Are you sure' not in stdout
+    lines = stdout.splitlines()
+    assert lines[0] == ("# line 1 FAILED: server -d server0 server1 --backend "
+                        "backend0: operation needs confirmation, use --force")
+    assert lines[-1] == "# line 2 OK: server -s server0 --backend backend0"
+
+
+def test_unexpected_error(monkeypatch):
+    def main():
+        raise KeyError('ConnRateLimit')
+
+    monkeypatch.setattr(dump, 'main', main)
+    assert (batch.run(['dump']) ==
+            "unexpected error KeyError: 'ConnRateLimit'")
@@ -0,0 +1,24 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import pytest
+
+from haproxytool.bulk import chunks, escape
+
+
+@pytest.mark.parametrize('value, escaped', [
+    ('example.com', 'example.com'),
+    ('a b', r'a\ b'),
+    ('a;b', r'a\;b'),
+    (r'a\b', r'a\\b'),
+    # A backslash is escaped before the characters which it escapes
+    (r'a\ b;', r'a\\\ b\;'),
+])
+def test_escape(value, escaped):
+    assert escape(value) == escaped
+
+
+def test_chunks():
+    assert list(chunks(range(5), size=2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunks(range(4), size=2)) == [[0, 1], [2, 3]]
+    assert list(chunks(iter([]), size=2)) == []
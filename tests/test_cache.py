@@ -0,0 +1,60 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import pytest
+
+from haproxytool.cache import load, save, same_processes, strip
+
+IDENTITY = [['/run/haproxy/1.sock', 1, 100, 1000],
+            ['/run/haproxy/2.sock', 2, 101, 1000]]
+STATS = [
+    '# pxname,svname,qcur,scur,status,pid,iid,sid,',
+    'fe0,FRONTEND,,0,OPEN,100,2,0,',
+    'be0,srv0,0,0,UP,100,3,1,',
+    '',
+]
+
+
+def test_same_processes_in_any_order():
+    assert same_processes(IDENTITY, list(reversed(IDENTITY)))
+
+
+@pytest.mark.parametrize('start_time, same', [
+    (1002, True),
+    (998, True),
+    (1003, False),
+])
+def test_start_time_slack(start_time, same):
+    current = [IDENTITY[0], IDENTITY[1][:3] + [start_time]]
+    assert same_processes(IDENTITY, current) is same
+
+
+@pytest.mark.parametrize('current', [
+    IDENTITY[:1],
+    [IDENTITY[0], ['/run/haproxy/2.sock', 2, 102, 1000]],
+    [IDENTITY[0], ['/run/haproxy/3.sock', 2, 101, 1000]],
+])
+def test_different_processes(current):
+    assert not same_processes(IDENTITY, current)
+
+
+def test_strip_keeps_only_saved_fields():
+    assert strip(STATS) == [
+        '# pxname,svname,iid,sid,',
+        'fe0,FRONTEND,2,0',
+        'be0,srv0,3,1',
+    ]
+
+
+@pytest.mark.parametrize('csv_data', [[], ['Unknown command.']])
+def test_strip_leaves_errors_as_they_are(csv_data):
+    assert strip(csv_data) == csv_data
+
+
+def test_load_what_was_saved(tmp_path):
+    path = str(tmp_path / 'cache' / 'topology.json')
+    stats = [[1, strip(STATS)]]
+    save(path, IDENTITY, stats)
+    assert load(path, IDENTITY) == stats
+    assert load(path, IDENTITY[:1]) is None
+    assert load(str(tmp_path / 'missing.json'), IDENTITY) is None
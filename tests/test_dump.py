@@ -0,0 +1,47 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import io
+import csv
+
+from haproxytool.dump import dump
+from haproxytool.output import Writer
+from haproxytool.snapshot import Snapshot
+
+HEADER = '# pxname,svname,status,stot,req_tot,'
+STATS = [
+    HEADER,
+    'fe0,FRONTEND,OPEN,0,10,',
+    'be0,srv0,UP,3,,',
+    'be0,srv1,DOWN,4,,',
+    'be0,BACKEND,UP,7,,',
+]
+
+
+def run_dump(hap, output):
+    stream = io.StringIO()
+    snapshot = Snapshot(hap, [(1, STATS), (2, STATS)])
+    dump(snapshot, Writer(output, stream))
+
+    return stream.getvalue()
+
+
+def test_csv_is_a_single_table(fake_haproxy):
+    rows = list(csv.reader(io.StringIO(run_dump(fake_haproxy, 'csv'))))
+    assert rows[0] == ['type', 'name', 'status', 'requests', 'process_nb',
+                       'servers', 'backend']
+    assert rows[1:] == [
+        ['frontend', 'fe0', 'OPEN', '20', '1 2', '', ''],
+        ['backend', 'be0', 'UP', '14', '', 'srv0 srv1', ''],
+        ['server', 'srv0', 'UP', '6', '', '', 'be0'],
+        ['server', 'srv1', 'DOWN', '8', '', '', 'be0'],
+    ]
+
+
+def test_table_has_a_header_per_section(fake_haproxy):
+    lines = run_dump(fake_haproxy, 'table').splitlines()
+    assert [x for x in lines if x.startswith('#')] == [
+        '# frontend name, status, requests, process_nb',
+        '# backend name, status, requests, servers',
+        '# server name, status, requests, backend',
+    ]
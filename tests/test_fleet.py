@@ -0,0 +1,71 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import json
+import socket
+
+from haproxytool import fleet
+
+
+def test_target_which_hangs_is_killed(tmp_path):
+    # A stats socket which accepts connections and never answers
+    socket_file = str(tmp_path / 'hang.sock')
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_file)
+    listener.listen(8)
+    try:
+        error = fleet.run_target(('hang', socket_file), [], ['haproxy', '-i'],
+                                 fleet.Output('table'), 0.2)
+    finally:
+        listener.close()
+
+    assert error == "timed out after 0.2 seconds"
+
+
+def test_fleet_options_are_not_passed():
+    argv = ['--targets', 'edge.txt', '--workers', '2', '--target-timeout=5',
+            '-P', '2', 'server', '-s']
+    args = {'<args>': ['-s']}
+    assert fleet.global_argv(argv, args) == ['-P', '2']
+
+
+def write(output, targets):
+    writer = fleet.Output(output)
+    for name, stdout in targets:
+        writer.add(name, stdout)
+    writer.close()
+
+
+def test_table_lines_are_prefixed(capsys):
+    write('table', [('a', '# name\nfe0\n'), ('b', 'fe1\n')])
+    assert capsys.readouterr().out == "a: # name\na: fe0\nb: fe1\n"
+
+
+def test_csv_has_a_single_header(capsys):
+    write('csv', [('a', 'name,status\nfe0,OPEN\n'),
+                  ('b', 'name,status\nfe1,STOP\n'), ('c', '')])
+    assert capsys.readouterr().out == ("host,name,status\na,fe0,OPEN\n"
+                                       "b,fe1,STOP\n")
+
+
+def test_json_rows_of_all_targets_are_one_document(capsys):
+    write('json', [('a', '[\n{"name": "fe0"}\n]\n'), ('b', '[]\n'),
+                   ('c', '[\n{"name": "fe1"}\n]\n')])
+    assert json.loads(capsys.readouterr().out) == [
+        {'host': 'a', 'name': 'fe0'}, {'host': 'c', 'name': 'fe1'}]
+
+
+def test_json_sections_are_merged(capsys):
+    write('json', [('a', '{"frontends": [{"name": "fe0"}], "servers": []}'),
+                   ('b', '{"frontends": [{"name": "fe1"}]}')])
+    assert json.loads(capsys.readouterr().out) == {
+        'frontends': [{'host': 'a', 'name': 'fe0'},
+                      {'host': 'b', 'name': 'fe1'}],
+        'servers': [],
+    }
+
+
+def test_ndjson_rows_have_a_host_key(capsys):
+    write('ndjson', [('a', '{"name": "fe0"}\nfe9 was not found\n')])
+    assert capsys.readouterr().out == ('{"host": "a", "name": "fe0"}\n'
+                                       'a: fe9 was not found\n')
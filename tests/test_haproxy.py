@@ -0,0 +1,29 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import pytest
+
+
+@pytest.mark.parametrize('options', [[], ['-P', '2']])
+def test_metric(haproxytool, socket_dir, options):
+    status, stdout, _ = haproxytool(*(options + ['haproxy', '-D', socket_dir,
+                                                 '-m', 'CumReq']))
+    assert status == 0
+    assert stdout == 'CumReq = 20\n'
+
+
+@pytest.mark.parametrize('option, output', [
+    ('-r', '20\n'),
+    ('-C', '4000\n'),
+])
+def test_metric_of_options(haproxytool, socket_dir, option, output):
+    status, stdout, _ = haproxytool('-P', '2', 'haproxy', '-D', socket_dir,
+                                    option)
+    assert status == 0
+    assert stdout == output
+
+
+def test_invalid_metric(haproxytool, socket_dir):
+    status, _, stderr = haproxytool('haproxy', '-D', socket_dir, '-m', 'Bogus')
+    assert status == 1
+    assert 'Bogus' in stderr
@@ -0,0 +1,63 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+from haproxytool import map as map_
+from haproxytool.usage import docopt
+
+MAP_FILE = u"""# key value
+a 1
+b 2
+b 3
+c 9
+d 4
+f 6 7
+"""
+
+
+class MapHAProxy(object):
+    """HAProxy with a map which records the commands sent to it"""
+    def __init__(self, entries):
+        self.entries = entries
+        self.sent = []
+
+    def show_map(self, mapid=None):
+        # pylint: disable=unused-argument
+        return ['0x{:x} {} {}'.format(number, key, value)
+                for number, (key, value) in enumerate(self.entries)]
+
+    def commands(self, cmds, pipeline=False):
+        # pylint: disable=unused-argument
+        self.sent.extend(x for x, _ in cmds)
+        return [[(1, '')] for _ in cmds]
+
+
+def sync(tmp_path, options=()):
+    path = tmp_path / 'entries.map'
+    path.write_text(MAP_FILE)
+    hap = MapHAProxy([('a', '1'), ('c', '3'), ('c', '5'), ('d', '0'),
+                      ('e', '7')])
+    arguments = docopt(map_.__doc__, ['map'] + list(options) +
+                       ['-y', '0', str(path)])
+    map_.MapCommand(hap, arguments).sync()
+
+    return hap.sent
+
+
+def test_sync(tmp_path, capsys):
+    assert sync(tmp_path) == [
+        'add map #0 b 2',
+        r'add map #0 f 6\ 7',
+        # c has two entries in the map, it is replaced by one entry
+        'del map #0 c',
+        'add map #0 c 9',
+        'set map #0 d 4',
+        'del map #0 e',
+    ]
+    assert capsys.readouterr().out.startswith(
+        "2 to add, 2 to update, 1 to delete, 1 unchanged\n")
+
+
+def test_dry_run(tmp_path, capsys):
+    assert sync(tmp_path, ['-n']) == []
+    assert capsys.readouterr().out == (
+        "2 to add, 2 to update, 1 to delete, 1 unchanged\n")
@@ -0,0 +1,68 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring,protected-access
+import pytest
+
+from haproxytool.runtime import Session, chunks
+
+
+class FakeSocket(object):
+    """Socket which returns the given chunks from recv() one by one"""
+    def __init__(self, received):
+        self.received = list(received)
+        self.sent = []
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+    def recv(self, size):
+        # pylint: disable=unused-argument
+        return self.received.pop(0) if self.received else b''
+
+    def close(self):
+        pass
+
+
+def send(cmds, received):
+    session = Session('/run/haproxy.sock')
+    session._socket = FakeSocket(received)
+    outputs = session._send(cmds)
+
+    return outputs, session._socket.sent
+
+
+def test_output_ends_at_the_prompt():
+    outputs, sent = send(['show info'], [b'Name: HAProxy\nPid: 1\n\n> '])
+    assert sent == [b'show info\n']
+    assert outputs == [b'Name: HAProxy\nPid: 1\n\n']
+
+
+@pytest.mark.parametrize('received', [
+    [b'a\n', b'\n> b\n', b'\n> '],
+    [b'a\n\n', b'> b\n\n', b'> '],
+    [b'a\n\n>', b' b\n\n> '],
+    [b'a', b'\n', b'\n', b'>', b' ', b'b\n', b'\n>', b' '],
+])
+def test_prompt_split_across_chunks(received):
+    outputs, _ = send(['get a', 'get b'], received)
+    assert outputs == [b'a\n\n', b'b\n\n']
+
+
+def test_commands_are_pipelined_in_one_line():
+    received = [b'1\n\n> \n> \n> 4\n\n> ']
+    outputs, sent = send(['get 1', 'set 2;set 3', r'add 4\;5'], received)
+    assert sent == [b'get 1;set 2;set 3;add 4\\;5\n']
+    # The output of a command with a semicolon is the output of its parts
+    assert outputs == [b'1\n\n', b'\n\n', b'4\n\n']
+
+
+def test_closed_connection():
+    with pytest.raises(EOFError):
+        send(['show info'], [b'Name: HAProxy\n'])
+
+
+def test_chunks():
+    cmds = ['a' * 3, 'b' * 3, 'c' * 6, 'd' * 20]
+    assert list(chunks(cmds, size=8)) == [cmds[:2], cmds[2:3], cmds[3:]]
+    assert list(chunks(cmds)) == [cmds]
+    assert list(chunks([])) == []
@@ -0,0 +1,43 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import json
+
+import pytest
+
+from haproxytool import server
+from haproxytool.usage import docopt
+
+
+def test_weight_is_a_number(haproxytool, socket_dir):
+    status, stdout, _ = haproxytool('--output', 'json', 'server', '-D',
+                                    socket_dir, '-W', '--backend', 'backend0')
+    assert status == 0
+    rows = json.loads(stdout)
+    assert rows
+    assert all(isinstance(x['weight'], int) for x in rows)
+
+
+HEADER = '# pxname,svname,status,scur,'
+STATS = [
+    [HEADER, 'be0,srv0,UP,3,', 'be0,srv1,UP,5,', 'be0,BACKEND,UP,8,'],
+    # srv1 is removed from HAProxy while srv0 is drained
+    [HEADER, 'be0,srv0,UP,0,', 'be0,BACKEND,UP,0,'],
+]
+
+
+@pytest.mark.parametrize('max_draining', ['1', '2'])
+def test_rolling_drain_of_a_removed_server(fake_haproxy, capsys,
+                                           max_draining):
+    outputs = list(STATS)
+    fake_haproxy.command = lambda command: [(1, outputs.pop(0))]
+    arguments = docopt(server.__doc__, ['server', '-f', '--rolling-drain',
+                                        '--max-draining', max_draining,
+                                        '--interval', '0'])
+    cmd = server.ServerCommand(fake_haproxy, arguments)
+    cmd.report = lambda cmds, done_msg, failed_msg, servers: []
+    cmd.rollingdrain()
+
+    stdout = capsys.readouterr().out
+    assert 'srv0 drained in be0 backend' in stdout
+    assert 'srv1 is gone from be0 backend, considered drained' in stdout
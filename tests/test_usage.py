@@ -0,0 +1,47 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import docopt
+import pytest
+
+from haproxytool import server, usage
+
+DOC = """Usage:
+    prog [-v...] [--name=<name>...] [-f] ARG...
+
+Options:
+    -v             more output
+    -f, --force    force
+    --name=<name>  a name
+"""
+
+
+@pytest.mark.parametrize('argv', [
+    ['a'],
+    ['-vv', '--name', 'x', '--name=y', 'a', 'b'],
+    ['-f', 'a'],
+])
+def test_same_as_docopt(argv):
+    expected = docopt.docopt(DOC, argv)
+    assert usage.docopt(DOC, argv) == expected
+    # The second call uses the pattern kept in memory
+    assert usage.docopt(DOC, argv) == expected
+
+
+def test_results_are_not_shared():
+    first = usage.docopt(DOC, ['--name', 'x', 'a'])
+    first['--name'].append('y')
+    first['ARG'].append('b')
+    assert usage.docopt(DOC, ['a']) == docopt.docopt(DOC, ['a'])
+
+
+def test_help_exits_before_pattern_is_built():
+    doc = DOC.replace('prog', 'help')
+    with pytest.raises(SystemExit):
+        usage.docopt(doc, ['-h'])
+    assert doc not in usage.PATTERNS
+
+
+def test_fix_is_same_as_docopt():
+    expected = usage.build(server.__doc__)[1].fix()
+    assert repr(usage.fix(usage.build(server.__doc__)[1])) == repr(expected)
@@ -0,0 +1,40 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import pytest
+
+from haproxytool.utils import name_matcher, select
+
+NAMES = ['web-1', 'web-2', 'web-10', 'db-1', 'web-1']
+
+
+@pytest.mark.parametrize('selector, matching', [
+    ('web-*', ['web-1', 'web-2', 'web-10']),
+    ('web-?', ['web-1', 'web-2']),
+    ('/^web-[0-9]$/', ['web-1', 'web-2']),
+    ('/1$/', ['web-1', 'db-1']),
+])
+def test_name_matcher(selector, matching):
+    matcher = name_matcher(selector)
+    assert [x for x in ['web-1', 'web-2', 'web-10', 'db-1']
+            if matcher(x)] == matching
+
+
+@pytest.mark.parametrize('selector', ['web-1', '/', '//'])
+def test_plain_name_has_no_matcher(selector):
+    assert name_matcher(selector) is None
+
+
+def test_invalid_regular_expression():
+    with pytest.raises(ValueError, match='invalid regular expression'):
+        name_matcher('/web-[/')
+
+
+def test_select_in_order_of_selectors_without_duplicates():
+    assert select(NAMES, ['db-1', 'web-*', 'web-2']) == (
+        ['db-1', 'web-1', 'web-2', 'web-10'], [])
+
+
+def test_select_reports_selectors_which_match_nothing():
+    assert select(NAMES, ['web-3', 'web-1', 'app-*']) == (
+        ['web-1'], ['web-3', 'app-*'])
@@ -0,0 +1,57 @@
+# vim:fenc=utf-8
+#
+# pylint: disable=missing-docstring
+import pytest
+
+from haproxytool.snapshot import Snapshot
+from haproxytool.where import compile_expression, where
+
+STATS = [
+    '# pxname,svname,scur,qcur,status,weight,',
+    'be0,srv0,1,0,UP,1,',
+    'be0,srv1,2,0,DOWN,0,',
+    'be0,srv2,150,3,UP,1,',
+    'be0,BACKEND,153,3,UP,2,',
+]
+
+
+@pytest.fixture
+def names(fake_haproxy):
+    """Return a function which returns names of servers which match an
+    expression"""
+    servers = Snapshot(fake_haproxy, [(1, STATS)]).servers()
+
+    def matching(expression):
+        return [x.name for x in where(expression, servers, servers,
+                                      lambda x: x.name)]
+
+    return matching
+
+
+def test_comparisons(names):
+    assert names('status==DOWN') == ['srv1']
+    assert names('scur>1 and status!=DOWN') == ['srv2']
+    assert names('not (weight==0 or qcur>0)') == ['srv0']
+    assert names("name~'srv[01]'") == ['srv0', 'srv1']
+
+
+@pytest.mark.parametrize('expression', ['scur>1.5', 'scur<=0.9'])
+def test_operand_with_a_fraction_is_rejected(expression):
+    with pytest.raises(ValueError, match='expects a number'):
+        compile_expression(expression)
+
+
+def test_equality_with_a_fraction_is_not_truncated(names):
+    assert names('scur==1.0') == []
+
+
+@pytest.mark.parametrize('expression',
+                         ['status==', '(status==UP', 'status==UP or'])
+def test_invalid_expression(expression):
+    with pytest.raises(ValueError):
+        compile_expression(expression)
+
+
+def test_unknown_field(names):
+    with pytest.raises(ValueError, match='unknown field foo'):
+        names('foo==1')